@@ -1,14 +1,36 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from src.auth.middleware import AuthMiddleware
 from fastapi.staticfiles import StaticFiles
-from src.core.dependencies import get_user_store
+from src.core.dependencies import (
+    get_generation_queue,
+    get_image_store,
+    get_user_store,
+)
+from src.core.middleware import BodySizeLimitMiddleware
+from src.core.settings import settings
 from src.routes import auth, gallery, images, screenplay
 
-app = FastAPI(docs_url=None, redoc_url=None)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Run the screenplay generation workers for the lifetime of the app
+    generation_queue = get_generation_queue()
+    generation_queue.start()
+    yield
+    # Let running jobs finish, Cloud Run allows 10 seconds after SIGTERM
+    await generation_queue.stop(timeout=settings.GENERATION_DRAIN_TIMEOUT)
+    get_image_store().shutdown()
+
+
+app = FastAPI(docs_url=None, redoc_url=None, lifespan=lifespan)
 
 # Add authentication middleware
 app.middleware("http")(AuthMiddleware(get_user_store()))
 
+# Reject oversized uploads, by their Content-Length or while they are read
+app.add_middleware(BodySizeLimitMiddleware, max_upload_bytes=settings.UPLOAD_MAX_BYTES)
+
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -0,0 +1,98 @@
+"""Verification of Google ID tokens with cached signing certificates."""
+
+import json
+import re
+import threading
+import time
+import jwt
+import requests
+from typing import Any, Dict, Optional
+from google.auth import jwt as google_jwt
+from google.auth.transport.requests import Request
+
+GOOGLE_CERTS_URL = "https://www.googleapis.com/oauth2/v1/certs"
+GOOGLE_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+
+# How long to keep certificates when the response has no max-age
+DEFAULT_CERTS_TTL = 300
+
+# Minimum seconds between refreshes caused by unknown key IDs
+MIN_REFRESH_INTERVAL = 60
+
+MAX_AGE_PATTERN = re.compile(r"max-age=(\d+)")
+
+
+class GoogleTokenVerifier:
+    """
+    Verifies Google ID tokens against Google's signing certificates.
+
+    The certificates are fetched over a pooled HTTP session and kept for as
+    long as their Cache-Control max-age allows, so a login normally verifies
+    without any network traffic. A token signed with an unknown key triggers
+    an early refresh, at most once a minute, for when Google rotates keys.
+    verify() does blocking I/O and CPU work, call it from a worker thread.
+    """
+
+    def __init__(
+        self,
+        client_id: str,
+        certs_url: str = GOOGLE_CERTS_URL,
+        session: Optional[requests.Session] = None,
+        timeout: float = 10,
+    ):
+        self.client_id = client_id
+        self.certs_url = certs_url
+        self.timeout = timeout
+        self._request = Request(session=session or requests.Session())
+        self._certs: Dict[str, str] = {}
+        self._expires_at = 0.0
+        self._fetched_at = float("-inf")
+        self._lock = threading.Lock()
+        self.fetches = 0
+
+    def _fetch_certs(self):
+        response = self._request(self.certs_url, method="GET", timeout=self.timeout)
+        if response.status != 200:
+            raise ValueError(f"Could not fetch certificates: {response.status}")
+
+        match = MAX_AGE_PATTERN.search(response.headers.get("cache-control", ""))
+        ttl = int(match.group(1)) if match else DEFAULT_CERTS_TTL
+        # Responses from a shared cache have already aged
+        ttl -= int(response.headers.get("age", 0))
+
+        self._certs = json.loads(response.data)
+        self._fetched_at = time.monotonic()
+        self._expires_at = self._fetched_at + max(ttl, 0)
+        self.fetches += 1
+
+    def get_certs(self, key_id: Optional[str] = None) -> Dict[str, str]:
+        """Return the current certificates, refreshing them when expired"""
+        with self._lock:
+            now = time.monotonic()
+            unknown_key = key_id and key_id not in self._certs
+            if now >= self._expires_at or (
+                unknown_key and now - self._fetched_at >= MIN_REFRESH_INTERVAL
+            ):
+                try:
+                    self._fetch_certs()
+                except Exception:
+                    # Keep using the previous certificates for a while
+                    if not self._certs:
+                        raise
+                    self._fetched_at = now
+                    self._expires_at = now + MIN_REFRESH_INTERVAL
+            return self._certs
+
+    def verify(self, token: str) -> Dict[str, Any]:
+        """Verify the signature, audience and issuer of an ID token"""
+        try:
+            key_id = jwt.get_unverified_header(token).get("kid")
+        except jwt.InvalidTokenError as e:
+            raise ValueError("Malformed token") from e
+
+        id_info = google_jwt.decode(
+            token, certs=self.get_certs(key_id), audience=self.client_id
+        )
+        if id_info.get("iss") not in GOOGLE_ISSUERS:
+            raise ValueError(f"Wrong issuer: {id_info.get('iss')}")
+        return id_info
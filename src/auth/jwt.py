@@ -1,12 +1,23 @@
 import jwt
 from datetime import datetime, timedelta, timezone
-from typing import Dict, Any
+from fastapi import Response
+from typing import Dict, Any, Optional
 from src.core.settings import settings
 
+# User fields copied into the session token when FAT_SESSION is enabled
+SESSION_USER_FIELDS = ("name", "picture", "email")
 
-def create_jwt_token(user_data: Dict[str, Any]) -> str:
+
+def session_expiry() -> datetime:
+    """Expiration time for a new session"""
+    return datetime.now(timezone.utc) + timedelta(days=settings.TOKEN_EXPIRE_DAYS)
+
+
+def create_jwt_token(
+    user_data: Dict[str, Any], expires_at: Optional[datetime] = None
+) -> str:
     """Create a JWT token containing user data"""
-    expiration = datetime.now(timezone.utc) + timedelta(days=settings.TOKEN_EXPIRE_DAYS)
+    expiration = expires_at or session_expiry()
 
     token_data = {**user_data, "exp": expiration}
 
@@ -23,3 +34,47 @@ def decode_jwt_token(token: str) -> Dict[str, Any]:
         raise ValueError("Token has expired")
     except jwt.InvalidTokenError:
         raise ValueError("Invalid token")
+
+
+def session_snapshot(user: Dict[str, Any]) -> Dict[str, Any]:
+    """The display fields of a user that are kept in a fat session token"""
+    return {field: user.get(field) for field in SESSION_USER_FIELDS}
+
+
+def create_session_token(
+    user: Dict[str, Any], expires_at: Optional[datetime] = None
+) -> str:
+    """
+    Create the session token for a user. With FAT_SESSION enabled it carries
+    a versioned snapshot of the user's display fields, so pages can be
+    rendered without looking the user up.
+    """
+    token_data = {"user_id": user["id"]}
+    if settings.FAT_SESSION:
+        token_data["user"] = session_snapshot(user)
+        token_data["version"] = settings.SESSION_VERSION
+    return create_jwt_token(token_data, expires_at)
+
+
+def session_user(token_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """The user snapshot in a decoded session token, None if missing or stale"""
+    if (
+        not settings.FAT_SESSION
+        or token_data.get("version") != settings.SESSION_VERSION
+        or "user" not in token_data
+    ):
+        return None
+    return {"id": token_data["user_id"], **token_data["user"]}
+
+
+def set_session_cookie(response: Response, token: str, expires_at: datetime):
+    """Set the session cookie, it expires a minute before the token does"""
+    max_age = int((expires_at - datetime.now(timezone.utc)).total_seconds()) - 60
+    response.set_cookie(
+        key="session_token",
+        value=token,
+        httponly=True,
+        secure=True,
+        samesite="Lax",
+        max_age=max_age,
+    )
@@ -1,15 +1,39 @@
+from datetime import datetime, timezone
 from fastapi import Request
 from typing import Optional
 from src.storage.user_store import UserStore
-from src.auth.jwt import decode_jwt_token
+from src.auth.jwt import (
+    create_session_token,
+    decode_jwt_token,
+    session_snapshot,
+    session_user,
+    set_session_cookie,
+)
+from src.core.settings import settings
 
 
 class AuthMiddleware:
     def __init__(self, user_store: UserStore):
         self.user_store = user_store
 
-    async def get_current_user(self, request: Request) -> Optional[dict]:
-        """Get the current user from the session token"""
+    async def get_current_user(
+        self, request: Request, authoritative: bool = False
+    ) -> Optional[dict]:
+        """
+        Get the current user from the session token, resolved once per request.
+
+        With FAT_SESSION enabled the user is built from the snapshot in the
+        token. Pass authoritative=True to load the stored user record instead.
+        """
+        state = request.state
+        if not hasattr(state, "current_user") or (
+            authoritative and not state.current_user_stored
+        ):
+            state.current_user_stored = False
+            state.current_user = await self._load_user(request, authoritative)
+        return state.current_user
+
+    async def _load_user(self, request: Request, authoritative: bool) -> Optional[dict]:
         token = request.cookies.get("session_token")
         if not token:
             return None
@@ -17,14 +41,39 @@ class AuthMiddleware:
         try:
             # Verify and decode the JWT token
             user_data = decode_jwt_token(token)
+            if not authoritative:
+                user = session_user(user_data)
+                if user:
+                    return user
+
             user = await self.user_store.get_user_by_id(user_data["user_id"])
+            request.state.current_user_stored = True
+            if (
+                user
+                and settings.FAT_SESSION
+                and session_user(user_data)
+                != {"id": user["id"], **session_snapshot(user)}
+            ):
+                # Missing, stale or outdated snapshot, replace it in the response
+                request.state.refresh_session = (user, user_data["exp"])
             return user
         except:
             return None
 
     async def __call__(self, request: Request, call_next):
         # Attach the get_current_user method to the request state
-        request.state.get_current_user = lambda: self.get_current_user(request)
+        request.state.get_current_user = lambda authoritative=False: (
+            self.get_current_user(request, authoritative)
+        )
 
         response = await call_next(request)
+
+        refresh = getattr(request.state, "refresh_session", None)
+        if refresh and "session_token" not in response.headers.get("set-cookie", ""):
+            user, expires_at = refresh
+            # Keep the expiration of the original session
+            expires_at = datetime.fromtimestamp(expires_at, timezone.utc)
+            set_session_cookie(
+                response, create_session_token(user, expires_at), expires_at
+            )
         return response
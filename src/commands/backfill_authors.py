@@ -0,0 +1,73 @@
+"""
+Store the author snapshot on screenplays created before it existed.
+
+Usage: python -m src.commands.backfill_authors [--limit N] [--dry-run]
+"""
+
+import argparse
+import asyncio
+from src.core.dependencies import get_screenplay_store, get_user_store
+from src.storage.screenplay_store import author_snapshot
+
+# Firestore allows at most 500 writes in a batch
+BATCH_SIZE = 500
+
+
+async def backfill(limit: int = None, dry_run: bool = False):
+    screenplay_store = get_screenplay_store()
+    user_store = get_user_store()
+
+    # Only the owner and the snapshot are needed to find screenplays to update
+    query = screenplay_store.screenplays.select(["user_id", "author"])
+    missing = []
+    async for doc in query.stream():
+        data = doc.to_dict()
+        if "author" in data:
+            continue
+        missing.append((doc.reference, data["user_id"]))
+        if limit and len(missing) >= limit:
+            break
+
+    # Look each author up once, no matter how many screenplays they wrote
+    user_ids = sorted({user_id for _, user_id in missing})
+    users = await asyncio.gather(*map(user_store.get_user_by_id, user_ids))
+    authors = {
+        user_id: author_snapshot(user) for user_id, user in zip(user_ids, users) if user
+    }
+
+    updated = skipped = 0
+    batch = screenplay_store.db.batch()
+    for doc_ref, user_id in missing:
+        if user_id not in authors:
+            print(f"Skipping {doc_ref.id}, user {user_id} doesn't exist")
+            skipped += 1
+            continue
+        if dry_run:
+            print(f"Would backfill {doc_ref.id}")
+            continue
+
+        batch.update(doc_ref, {"author": authors[user_id]})
+        updated += 1
+        if updated % BATCH_SIZE == 0:
+            await batch.commit()
+            batch = screenplay_store.db.batch()
+
+    if updated % BATCH_SIZE:
+        await batch.commit()
+    print(f"Backfilled {updated} screenplays, skipped {skipped}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--limit", type=int, help="Backfill at most this many screenplays"
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Only list the screenplays to backfill"
+    )
+    args = parser.parse_args()
+    asyncio.run(backfill(args.limit, args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
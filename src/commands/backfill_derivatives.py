@@ -0,0 +1,88 @@
+"""
+Create the resized derivatives for images uploaded before they existed.
+
+Usage: python -m src.commands.backfill_derivatives [--limit N] [--dry-run]
+"""
+
+import argparse
+import asyncio
+import sys
+from src.core.dependencies import get_image_store
+from src.storage.image_processing import IMAGE_FORMATS, IMAGE_SIZES
+from src.storage.image_store import ImageStore, derivative_name
+
+
+async def backfill_image(image_store: ImageStore, image_id: str):
+    """Create and store the missing derivatives of a single image"""
+    # The full size JPEG is the only version every image has
+    full_image = await image_store.download_image(image_id)
+    derivatives = await image_store.image_workers.create_derivatives(
+        full_image, IMAGE_SIZES, IMAGE_FORMATS
+    )
+    # Keep the original full size JPEG as it is
+    del derivatives[("full", "jpeg")]
+
+    await image_store.store_derivatives(image_id, derivatives)
+    await image_store.images.document(image_id).update(
+        {
+            "derivatives": [derivative_name("full", "jpeg")]
+            + [derivative_name(*key) for key in derivatives]
+        }
+    )
+
+
+async def backfill(limit: int = None, concurrency: int = 4, dry_run: bool = False):
+    image_store = get_image_store()
+    expected = {
+        derivative_name(size, image_format)
+        for size in IMAGE_SIZES
+        for image_format in IMAGE_FORMATS
+    }
+    semaphore = asyncio.Semaphore(concurrency)
+    done = failed = 0
+
+    async def run(image_id: str):
+        nonlocal done, failed
+        async with semaphore:
+            try:
+                await backfill_image(image_store, image_id)
+                done += 1
+                print(f"Backfilled {image_id}")
+            except Exception as e:
+                failed += 1
+                print(f"Failed to backfill {image_id}: {str(e)}", file=sys.stderr)
+
+    tasks = []
+    found = 0
+    async for doc in image_store.images.stream():
+        data = doc.to_dict()
+        # Skip aliases of older images and images that are complete
+        if "image_id" in data or expected.issubset(data.get("derivatives", [])):
+            continue
+        found += 1
+        if dry_run:
+            print(f"Would backfill {doc.id}")
+        else:
+            tasks.append(asyncio.create_task(run(doc.id)))
+        if limit and found >= limit:
+            break
+
+    await asyncio.gather(*tasks)
+    print(f"Backfilled {done} images, {failed} failed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--limit", type=int, help="Backfill at most this many images")
+    parser.add_argument(
+        "--concurrency", type=int, default=4, help="Images to process at once"
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Only list the images to backfill"
+    )
+    args = parser.parse_args()
+    asyncio.run(backfill(args.limit, args.concurrency, args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
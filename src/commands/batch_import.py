@@ -0,0 +1,234 @@
+"""
+Generate screenplays for a directory of images.
+
+Usage: python -m src.commands.batch_import DIRECTORY --user-id ID [--public]
+    [--concurrency N] [--calls-per-minute N] [--checkpoint FILE]
+
+Images that were imported before, according to the checkpoint file, are
+skipped, so an interrupted import can be restarted with the same command.
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from src.core.dependencies import (
+    create_screenplay_generator,
+    get_gallery_cache,
+    get_genai_client,
+    get_image_store,
+    get_screenplay_store,
+    get_user_store,
+)
+from src.core.settings import settings
+from src.storage.image_upload import sniff_content_type
+from src.writing.model_gateway import ModelGateway
+from src.writing.screenplay_graph import ScreenplayGenerator
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".heic", ".heif"}
+
+
+def find_images(directory: Path) -> list[Path]:
+    """All images in a directory and its subdirectories, in a stable order"""
+    return sorted(
+        path
+        for path in directory.rglob("*")
+        if path.is_file() and path.suffix.lower() in IMAGE_EXTENSIONS
+    )
+
+
+def load_checkpoint(checkpoint: Path) -> set[str]:
+    """Paths of the images that were imported before"""
+    if not checkpoint.exists():
+        return set()
+    with checkpoint.open() as f:
+        return {json.loads(line)["path"] for line in f if line.strip()}
+
+
+class BatchImport:
+    def __init__(
+        self,
+        directory: Path,
+        author: dict,
+        generator: ScreenplayGenerator,
+        checkpoint: Path,
+        concurrency: int = 4,
+        public: bool = False,
+    ):
+        self.directory = directory
+        self.author = author
+        self.generator = generator
+        self.checkpoint = checkpoint
+        self.concurrency = concurrency
+        self.public = public
+        self.image_store = get_image_store()
+        self.screenplay_store = get_screenplay_store()
+        self.timings: dict[str, list[float]] = defaultdict(list)
+        self.done = 0
+        self.failed = 0
+
+    async def import_image(self, path: Path) -> dict:
+        """Store an image and generate and store its screenplay"""
+        contents = await asyncio.to_thread(path.read_bytes)
+        content_type = sniff_content_type(contents[:16])
+        if not content_type:
+            raise ValueError("Not a supported image")
+
+        start = time.perf_counter()
+        image_id, resized_image = await self.image_store.process_and_store_image(
+            contents, content_type
+        )
+        self.timings["store_image"].append(time.perf_counter() - start)
+
+        final_state = await self.generator.generate_from_image(resized_image)
+        for stage, seconds in final_state.get("timings", {}).items():
+            self.timings[stage].append(seconds)
+
+        start = time.perf_counter()
+        screenplay_data = {
+            "user_id": self.author["id"],
+            "raw_scene": final_state["scene"],
+            "structured_scene": final_state["structured_scene"].model_dump(),
+            "genre": final_state["genre"],
+            "models": final_state["models"],
+            "analysis": final_state.get("analysis"),
+            "public": self.public,
+        }
+        screenplay_id = await self.screenplay_store.store_screenplay(
+            screenplay_data, image_id, author=self.author
+        )
+        self.timings["store_screenplay"].append(time.perf_counter() - start)
+
+        return {"image_id": image_id, "screenplay_id": screenplay_id}
+
+    async def run(self, paths: list[Path]):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        with self.checkpoint.open("a") as checkpoint:
+
+            async def run_one(path: Path):
+                relative_path = str(path.relative_to(self.directory))
+                async with semaphore:
+                    start = time.perf_counter()
+                    try:
+                        result = await self.import_image(path)
+                    except Exception as e:
+                        self.failed += 1
+                        print(f"Failed {relative_path}: {str(e)}", file=sys.stderr)
+                        return
+                    self.timings["total"].append(time.perf_counter() - start)
+
+                # Record progress right away, so a restart skips this image
+                checkpoint.write(json.dumps({"path": relative_path, **result}) + "\n")
+                checkpoint.flush()
+                self.done += 1
+                print(f"Imported {relative_path}: {result['screenplay_id']}")
+
+            await asyncio.gather(*map(run_one, paths))
+
+    def print_stats(self, elapsed: float):
+        per_minute = self.done / elapsed * 60 if elapsed else 0.0
+        print(
+            f"\nImported {self.done} images, {self.failed} failed, "
+            f"in {elapsed:.1f}s ({per_minute:.1f} per minute)"
+        )
+        for stage, seconds in self.timings.items():
+            if len(seconds) > 1:
+                p95 = statistics.quantiles(seconds, n=20)[-1]
+            else:
+                p95 = seconds[0]
+            print(
+                f"  {stage:<18} mean {statistics.mean(seconds):6.2f}s  "
+                f"p50 {statistics.median(seconds):6.2f}s  p95 {p95:6.2f}s"
+            )
+
+
+async def batch_import(
+    directory: Path,
+    user_id: str,
+    public: bool = False,
+    concurrency: int = 4,
+    calls_per_minute: float = 60,
+    checkpoint: Path = None,
+):
+    author = await get_user_store().get_user_by_id(user_id)
+    if not author:
+        raise SystemExit(f"User {user_id} doesn't exist")
+
+    checkpoint = checkpoint or directory / ".batch_import.jsonl"
+    imported = load_checkpoint(checkpoint)
+    paths = [
+        path
+        for path in find_images(directory)
+        if str(path.relative_to(directory)) not in imported
+    ]
+    print(f"Importing {len(paths)} images, skipping {len(imported)} imported before")
+
+    # A generator like the app's, with calls to each model limited to the rate
+    gateway = ModelGateway(
+        get_genai_client(),
+        rate_limits={
+            settings.CREATIVE_MODEL: calls_per_minute / 60,
+            settings.FLASH_MODEL: calls_per_minute / 60,
+        },
+        max_concurrency=concurrency * 2,
+        call_timeout=settings.MODEL_CALL_TIMEOUT,
+        max_retries=settings.MODEL_MAX_RETRIES,
+    )
+    generator = create_screenplay_generator(gateway)
+    batch = BatchImport(directory, author, generator, checkpoint, concurrency, public)
+
+    start = time.perf_counter()
+    await batch.run(paths)
+    batch.print_stats(time.perf_counter() - start)
+    for model, stats in gateway.stats().items():
+        print(
+            f"  {model}: {stats['calls']:.0f} calls, {stats['retries']:.0f} retries, "
+            f"{stats['throttled']:.0f} throttled, {stats['failures']:.0f} failed"
+        )
+
+    # Let a gallery cache that is shared with the app show the new screenplays
+    if public and batch.done:
+        get_gallery_cache().invalidate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("directory", type=Path, help="Directory with images")
+    parser.add_argument("--user-id", required=True, help="Owner of the screenplays")
+    parser.add_argument(
+        "--public", action="store_true", help="Show the screenplays in the gallery"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=4, help="Images to process at once"
+    )
+    parser.add_argument(
+        "--calls-per-minute",
+        type=float,
+        default=60,
+        help="Maximum number of calls per minute to each model",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        type=Path,
+        help="Progress file, DIRECTORY/.batch_import.jsonl by default",
+    )
+    args = parser.parse_args()
+    asyncio.run(
+        batch_import(
+            args.directory,
+            args.user_id,
+            args.public,
+            args.concurrency,
+            args.calls_per_minute,
+            args.checkpoint,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Measure the end-to-end time of a generation with and without the DAG mode.
+
+Usage: python -m src.commands.benchmark_generation_dag [--runs N]
+    [--scale X]
+
+The model calls and the storage of the uploaded image are faked with the
+latencies in LATENCIES, multiplied by scale. The sequential mode stores the
+image before generating, the DAG mode stores it while the screenplay is
+generated, the way the upload route does in each mode.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+from src.commands.benchmark_generator_setup import SCENE_JSON, SCENE_TEXT
+from src.writing.screenplay_graph import ScreenplayGenerator
+from src.writing.template_loader import TemplateLoader
+
+# Seconds per call, roughly what the models take in production
+LATENCIES = {
+    "analyze": 4.0,
+    "genre": 1.0,
+    "scene": 8.0,
+    "structure": 2.0,
+    "store_image": 1.5,
+}
+
+
+class SlowModels:
+    """Answers each kind of call after its latency"""
+
+    def __init__(self, scale: float):
+        self.scale = scale
+
+    async def generate_content(self, model, contents, config=None):
+        prompt = str(contents)
+        if getattr(config, "response_mime_type", None) == "application/json":
+            stage, text = "structure", SCENE_JSON
+        elif "Which movie genre" in prompt:
+            stage, text = "genre", "Comedy"
+        elif "Analyze a still" in prompt:
+            stage, text = "analyze", "A comedy, judging by the cat."
+        else:
+            stage, text = "scene", SCENE_TEXT
+        await asyncio.sleep(LATENCIES[stage] * self.scale)
+        return SimpleNamespace(text=text)
+
+
+async def generate(generator: ScreenplayGenerator, scale: float, run: int):
+    """Store the image and generate its screenplay like the upload route"""
+    store_image = asyncio.sleep(LATENCIES["store_image"] * scale)
+    if generator.dag:
+        image_stored = asyncio.create_task(store_image)
+        state = await generator.generate_from_image(f"image-{run}".encode())
+        await image_stored
+    else:
+        await store_image
+        state = await generator.generate_from_image(f"image-{run}".encode())
+    return state
+
+
+async def run(runs: int, scale: float):
+    client = SimpleNamespace(aio=SimpleNamespace(models=SlowModels(scale)))
+    for dag in (False, True):
+        generator = ScreenplayGenerator(client, TemplateLoader(), dag=dag)
+        seconds = []
+        timings = defaultdict(list)
+        for i in range(runs):
+            start = time.perf_counter()
+            state = await generate(generator, scale, i)
+            seconds.append(time.perf_counter() - start)
+            for stage, stage_seconds in state["timings"].items():
+                timings[stage].append(stage_seconds)
+
+        stages = ", ".join(
+            f"{stage} {statistics.mean(values):.2f}s"
+            for stage, values in timings.items()
+        )
+        mode = "dag" if dag else "sequential"
+        print(f"{mode:>10}: {statistics.mean(seconds):.2f}s ({stages})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3, help="Generations per mode")
+    parser.add_argument(
+        "--scale", type=float, default=0.1, help="Factor for the latencies"
+    )
+    args = parser.parse_args()
+    asyncio.run(run(args.runs, args.scale))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Measure the setup overhead of a screenplay generation.
+
+Usage: python -m src.commands.benchmark_generator_setup [--runs N]
+
+The model calls are answered right away by a fake client, so what is left
+is the work of the generator itself. The per-request mode builds a template
+loader and a generator, with its compiled graph, for every generation, the
+way the upload route did before the generator was shared.
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from types import SimpleNamespace
+from src.writing.screenplay_graph import ScreenplayGenerator
+from src.writing.template_loader import TemplateLoader
+
+SCENE_TEXT = "Genre: Comedy\nScene:\nINT. CAFE - DAY\n\nA cat naps on the counter."
+SCENE_JSON = json.dumps(
+    {
+        "genre": "Comedy",
+        "scene_heading": "INT. CAFE - DAY",
+        "elements": [{"type": "visual", "visual": "A cat naps on the counter."}],
+    }
+)
+
+
+class InstantModels:
+    """Answers every call right away"""
+
+    async def generate_content(self, model, contents, config=None):
+        if getattr(config, "response_mime_type", None) == "application/json":
+            return SimpleNamespace(text=SCENE_JSON)
+        return SimpleNamespace(text=SCENE_TEXT)
+
+
+def milliseconds(seconds: list[float]) -> str:
+    return (
+        f"mean {statistics.mean(seconds) * 1000:.2f}ms, "
+        f"median {statistics.median(seconds) * 1000:.2f}ms"
+    )
+
+
+async def run(runs: int):
+    client = SimpleNamespace(aio=SimpleNamespace(models=InstantModels()))
+
+    setup, per_request = [], []
+    for i in range(runs):
+        start = time.perf_counter()
+        generator = ScreenplayGenerator(client, TemplateLoader())
+        setup.append(time.perf_counter() - start)
+        await generator.generate_from_image(f"image-{i}".encode())
+        per_request.append(time.perf_counter() - start)
+
+    shared = []
+    generator = ScreenplayGenerator(client, TemplateLoader())
+    for i in range(runs):
+        start = time.perf_counter()
+        await generator.generate_from_image(f"image-{i}".encode())
+        shared.append(time.perf_counter() - start)
+
+    print(f"Setup of a generator: {milliseconds(setup)}")
+    print(f"Generation with a new generator: {milliseconds(per_request)}")
+    print(f"Generation with a shared generator: {milliseconds(shared)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--runs", type=int, default=200, help="Number of generations per mode"
+    )
+    args = parser.parse_args()
+    asyncio.run(run(args.runs))
+
+
+if __name__ == "__main__":
+    main()
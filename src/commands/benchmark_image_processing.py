@@ -0,0 +1,156 @@
+"""
+Measure the processing time and memory use of uploaded images.
+
+Usage: python -m src.commands.benchmark_image_processing [DIRECTORY]
+    [--limit N]
+
+Images in the directory are grouped by file extension. Without a directory,
+a corpus of phone-sized (4032x3024) JPEG, PNG and HEIC images is generated.
+Each mode runs in a process of its own for each group, so the peak RSS it
+reports is its own. The legacy mode is the pipeline uploads went through
+before: a JPEG round trip for other formats and a second resize of the
+stored image.
+"""
+
+import argparse
+import io
+import multiprocessing
+import resource
+import statistics
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from PIL import Image
+from src.storage.image_processing import (
+    IMAGE_FORMATS,
+    IMAGE_SIZES,
+    create_derivatives,
+)
+
+PHONE_SIZE = (4032, 3024)
+CORPUS_FORMATS = {"jpeg": "JPEG", "png": "PNG", "heic": "HEIF"}
+
+
+def generate_corpus(directory: Path, count: int):
+    """Phone-sized images in each format, some of them rotated by EXIF"""
+    gradient = Image.linear_gradient("L").resize(PHONE_SIZE)
+    image = Image.merge(
+        "RGB",
+        [
+            gradient,
+            gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT),
+            Image.effect_noise(PHONE_SIZE, 24),
+        ],
+    )
+    for i in range(count):
+        for extension, image_format in CORPUS_FORMATS.items():
+            exif = Image.Exif()
+            exif[274] = 6 if i % 2 else 1
+            try:
+                image.save(directory / f"{i}.{extension}", image_format, exif=exif)
+            except (KeyError, OSError):
+                # No encoder for the format in this Pillow build
+                continue
+
+
+def find_corpus(directory: Path, limit: int) -> dict[str, list[Path]]:
+    """Up to limit images per file extension"""
+    corpus = {}
+    for path in sorted(directory.iterdir()):
+        paths = corpus.setdefault(path.suffix.lower().lstrip("."), [])
+        if path.is_file() and len(paths) < limit:
+            paths.append(path)
+    return {extension: paths for extension, paths in corpus.items() if paths}
+
+
+def legacy_resize(image_data: bytes) -> bytes:
+    """The full size JPEG the way it was made before, see the module docstring"""
+    image = Image.open(io.BytesIO(image_data))
+    orientation = image.getexif().get(274)
+    if orientation in (3, 6, 8):
+        image = image.rotate({3: 180, 6: 270, 8: 90}[orientation], expand=True)
+    if image.mode in ("RGBA", "P", "CMYK"):
+        image = image.convert("RGB")
+    if image.format != "JPEG":
+        jpeg_buffer = io.BytesIO()
+        image.save(jpeg_buffer, format="JPEG", quality=85)
+        image = Image.open(jpeg_buffer)
+    max_width, max_height = IMAGE_SIZES["full"]
+    ratio = min(max_width / image.width, max_height / image.height)
+    if ratio < 1:
+        size = (int(image.width * ratio), int(image.height * ratio))
+        image = image.resize(size, Image.Resampling.LANCZOS)
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=85)
+    return output.getvalue()
+
+
+def process(mode: str, image_data: bytes):
+    if mode == "legacy":
+        # The stored image was resized a second time
+        legacy_resize(legacy_resize(image_data))
+    elif mode == "full jpeg":
+        create_derivatives(image_data, {"full": IMAGE_SIZES["full"]}, ["jpeg"])
+    else:
+        create_derivatives(image_data, IMAGE_SIZES, IMAGE_FORMATS)
+
+
+def run_mode(mode: str, paths: list[Path]) -> tuple[list, int]:
+    """Milliseconds per image and the peak RSS in bytes of this process"""
+    milliseconds = []
+    for path in paths:
+        image_data = path.read_bytes()
+        start = time.perf_counter()
+        process(mode, image_data)
+        milliseconds.append((time.perf_counter() - start) * 1000)
+    return milliseconds, peak_rss()
+
+
+def peak_rss() -> int:
+    """Peak RSS in bytes of this process"""
+    # On Linux ru_maxrss includes the peak of the parent before the fork
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # Reported in bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def benchmark(corpus: dict[str, list[Path]]):
+    if not corpus:
+        raise SystemExit("No images to process")
+    context = multiprocessing.get_context("spawn")
+    for extension, paths in corpus.items():
+        megabytes = sum(path.stat().st_size for path in paths) / len(paths) / 2**20
+        print(f"{len(paths)} {extension} images, {megabytes:.1f} MB on average")
+        for mode in ("legacy", "full jpeg", "all derivatives"):
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                milliseconds, peak = pool.submit(run_mode, mode, paths).result()
+            print(
+                f"  {mode:>16}: mean {statistics.mean(milliseconds):7.1f}ms, "
+                f"max {max(milliseconds):7.1f}ms per image, "
+                f"peak RSS {peak / 2**20:.0f} MB"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("directory", type=Path, nargs="?", help="Images to process")
+    parser.add_argument("--limit", type=int, default=3, help="Images per format")
+    args = parser.parse_args()
+
+    if args.directory:
+        benchmark(find_corpus(args.directory, args.limit))
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        generate_corpus(Path(directory), args.limit)
+        benchmark(find_corpus(Path(directory), args.limit))
+
+
+if __name__ == "__main__":
+    main()
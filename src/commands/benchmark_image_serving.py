@@ -0,0 +1,105 @@
+"""
+Measure the memory use of serving images to many clients at once.
+
+Usage: python -m src.commands.benchmark_image_serving [--requests N]
+    [--image-kb N]
+
+Every request reads an image from a fake blob store and sends it to a
+slow client. The buffered mode downloads the whole image first, the way
+images were served before they were streamed. Each mode runs in a process
+of its own, so the peak RSS it reports is its own.
+"""
+
+import argparse
+import asyncio
+import functools
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from src.commands.benchmark_image_processing import peak_rss
+from src.storage.image_body import BlobImageBody, MemoryImageBody
+
+# Seconds the client takes to receive a chunk
+CLIENT_DELAY = 0.01
+
+
+class FakeReader:
+    def __init__(self, size: int):
+        self.size = size
+        self.position = 0
+
+    def seek(self, position: int):
+        self.position = position
+
+    def read(self, size: int) -> bytes:
+        size = max(0, min(size, self.size - self.position))
+        self.position += size
+        return b"\xff" * size
+
+    def close(self):
+        pass
+
+
+class FakeBlob:
+    def __init__(self, size: int):
+        self.size = size
+
+    def download_as_bytes(self) -> bytes:
+        return b"\xff" * self.size
+
+    def open(self, mode: str, chunk_size: int) -> FakeReader:
+        return FakeReader(self.size)
+
+
+async def send(chunks):
+    async for chunk in chunks:
+        await asyncio.sleep(CLIENT_DELAY)
+
+
+async def serve(mode: str, requests: int, image_size: int):
+    executor = ThreadPoolExecutor(max_workers=16)
+    loop = asyncio.get_running_loop()
+
+    async def run_storage_call(func, *args):
+        return await loop.run_in_executor(executor, functools.partial(func, *args))
+
+    cached = b"\xff" * image_size
+
+    async def request():
+        blob = FakeBlob(image_size)
+        if mode == "buffered":
+            data = await run_storage_call(blob.download_as_bytes)
+            await send(MemoryImageBody(data).chunks())
+        elif mode == "streamed":
+            await send(BlobImageBody(blob, image_size, run_storage_call).chunks())
+        else:
+            await send(MemoryImageBody(cached).chunks())
+
+    await asyncio.gather(*[request() for _ in range(requests)])
+    executor.shutdown()
+
+
+def run_mode(mode: str, requests: int, image_size: int) -> tuple[float, int]:
+    """Seconds for all requests and the peak RSS in bytes of this process"""
+    start = time.perf_counter()
+    asyncio.run(serve(mode, requests, image_size))
+    return time.perf_counter() - start, peak_rss()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500, help="Concurrent requests")
+    parser.add_argument("--image-kb", type=int, default=1024, help="Image size")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    for mode in ("buffered", "streamed", "cached"):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            seconds, peak = pool.submit(
+                run_mode, mode, args.requests, args.image_kb * 1024
+            ).result()
+        print(f"{mode:>8}: {seconds:.2f}s, peak RSS {peak / 2**20:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
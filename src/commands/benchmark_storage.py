@@ -0,0 +1,121 @@
+"""
+Measure the throughput of the stores against a fake backend with latency.
+
+Usage: python -m src.commands.benchmark_storage [--requests N]
+    [--concurrency N] [--latency MS]
+
+Each request reads a screenplay, a user and an image, like a screenplay
+page does. The blocking mode calls a synchronous fake client from the event
+loop, the way the stores did before they used the async Firestore client
+and ran Cloud Storage calls on a thread pool.
+"""
+
+import argparse
+import asyncio
+import time
+from src.storage.image_store import ImageStore
+from src.storage.screenplay_store import ScreenplayStore
+from src.storage.user_store import UserStore
+
+
+class FakeSnapshot:
+    def __init__(self, doc_id: str):
+        self.id = doc_id
+        self.exists = True
+
+    def to_dict(self) -> dict:
+        return {"user_id": "user", "genre": "Comedy", "name": "Bo"}
+
+
+class FakeDocument:
+    def __init__(self, doc_id: str, latency: float, blocking: bool):
+        self.id = doc_id
+        self.latency = latency
+        self.blocking = blocking
+
+    async def get(self) -> FakeSnapshot:
+        if self.blocking:
+            time.sleep(self.latency)
+        else:
+            await asyncio.sleep(self.latency)
+        return FakeSnapshot(self.id)
+
+
+class FakeFirestore:
+    """Answers every document read after latency seconds"""
+
+    def __init__(self, latency: float, blocking: bool):
+        self.latency = latency
+        self.blocking = blocking
+
+    def collection(self, name: str) -> "FakeFirestore":
+        return self
+
+    def document(self, doc_id: str) -> FakeDocument:
+        return FakeDocument(doc_id, self.latency, self.blocking)
+
+
+class FakeBlob:
+    def __init__(self, name: str, latency: float):
+        self.name = name
+        self.latency = latency
+
+    def download_as_bytes(self) -> bytes:
+        time.sleep(self.latency)
+        return b"\xff\xd8\xff" + bytes(16 * 1024)
+
+
+class FakeStorage:
+    """A Cloud Storage client whose downloads take latency seconds"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def bucket(self, name: str) -> "FakeStorage":
+        return self
+
+    def blob(self, name: str) -> FakeBlob:
+        return FakeBlob(name, self.latency)
+
+
+async def run(requests: int, concurrency: int, latency: float, blocking: bool):
+    db = FakeFirestore(latency, blocking)
+    screenplay_store = ScreenplayStore(db)
+    user_store = UserStore(db)
+    image_store = ImageStore(FakeStorage(latency), db)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def request(i: int):
+        async with semaphore:
+            await screenplay_store.get_screenplay(f"screenplay-{i}")
+            await user_store.get_user_by_id(f"user-{i}")
+            if blocking:
+                image_store.get_image_blob(f"image-{i}").download_as_bytes()
+            else:
+                # A new image each time, so the image cache doesn't help
+                await image_store.download_image(f"image-{i}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*[request(i) for i in range(requests)])
+    elapsed = time.perf_counter() - start
+    image_store.shutdown()
+    mode = "blocking" if blocking else "async"
+    print(f"{mode:>8}: {requests / elapsed:8.1f} requests/s ({elapsed:.2f}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200, help="Total requests")
+    parser.add_argument(
+        "--concurrency", type=int, default=50, help="Requests in flight at once"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=20, help="Milliseconds per backend call"
+    )
+    args = parser.parse_args()
+    for blocking in (True, False):
+        asyncio.run(run(args.requests, args.concurrency, args.latency / 1000, blocking))
+
+
+if __name__ == "__main__":
+    main()
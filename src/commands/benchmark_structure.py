@@ -0,0 +1,113 @@
+"""
+Measure the local screenplay parser against recorded scenes.
+
+Usage: python -m src.commands.benchmark_structure [--limit N]
+    [--corpus FILE | --stored]
+
+The corpus is a JSONL file with "raw_scene" and optionally "structured_scene"
+on each line, the structured scene the Flash model made being the reference.
+By default it is the recorded scenes in tests/fixtures/scenes.jsonl. With
+--stored, the scenes of the latest stored screenplays are read from Firestore.
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from collections import Counter
+from pathlib import Path
+from src.writing.screenplay_parser import ScreenplayParseError, parse_screenplay
+
+DEFAULT_CORPUS = Path(__file__).parents[2] / "tests" / "fixtures" / "scenes.jsonl"
+
+
+async def load_stored(limit: int) -> list[dict]:
+    """The raw and structured scenes of the latest screenplays"""
+    # Imported here so the default corpus needs no credentials
+    from google.cloud import firestore
+    from src.core.dependencies import get_screenplay_store
+
+    query = (
+        get_screenplay_store()
+        .screenplays.order_by("created_at", direction=firestore.Query.DESCENDING)
+        .select(["raw_scene", "structured_scene"])
+        .limit(limit)
+    )
+    return [doc.to_dict() async for doc in query.stream()]
+
+
+def load_corpus(corpus: Path, limit: int) -> list[dict]:
+    with corpus.open() as f:
+        return [json.loads(line) for line in f if line.strip()][:limit]
+
+
+def same_structure(parsed: dict, reference: dict) -> bool:
+    """Whether the parser found the same heading and sequence of elements"""
+    return parsed["scene_heading"].strip().upper() == reference.get(
+        "scene_heading", ""
+    ).strip().upper() and [e["type"] for e in parsed["elements"]] == [
+        e.get("type") for e in reference.get("elements", [])
+    ]
+
+
+def benchmark(scenes: list[dict]):
+    seconds = []
+    parsed = matched = compared = 0
+    errors = Counter()
+    for scene in scenes:
+        start = time.perf_counter()
+        try:
+            result = parse_screenplay(scene["raw_scene"])
+        except ScreenplayParseError as e:
+            errors[str(e)] += 1
+            continue
+        finally:
+            seconds.append(time.perf_counter() - start)
+
+        parsed += 1
+        if scene.get("structured_scene"):
+            compared += 1
+            matched += same_structure(result, scene["structured_scene"])
+
+    total = len(scenes)
+    print(f"Parsed {parsed} of {total} scenes ({parsed / total:.1%})")
+    if compared:
+        print(f"Same structure as the reference: {matched} of {compared}")
+    print(
+        f"Parse time: mean {statistics.mean(seconds) * 1000:.3f}ms, "
+        f"max {max(seconds) * 1000:.3f}ms"
+    )
+    for error, count in errors.most_common():
+        print(f"  {count:4d}  {error}")
+
+
+async def run(limit: int, corpus: Path = DEFAULT_CORPUS, stored: bool = False):
+    scenes = await load_stored(limit) if stored else load_corpus(corpus, limit)
+    scenes = [scene for scene in scenes if scene.get("raw_scene")]
+    if not scenes:
+        raise SystemExit("No scenes to parse")
+    benchmark(scenes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--limit", type=int, default=500, help="Maximum number of scenes"
+    )
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument(
+        "--corpus",
+        type=Path,
+        default=DEFAULT_CORPUS,
+        help="JSONL file with recorded raw scenes",
+    )
+    source.add_argument(
+        "--stored", action="store_true", help="Read the stored screenplays"
+    )
+    args = parser.parse_args()
+    asyncio.run(run(args.limit, args.corpus, args.stored))
+
+
+if __name__ == "__main__":
+    main()
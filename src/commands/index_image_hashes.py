@@ -0,0 +1,54 @@
+"""
+Add hash aliases for images stored before images were keyed by their hash.
+
+Usage: python -m src.commands.index_image_hashes [--limit N] [--dry-run]
+"""
+
+import argparse
+import asyncio
+from google.api_core.exceptions import AlreadyExists
+from src.core.dependencies import get_image_store
+
+
+async def index(limit: int = None, dry_run: bool = False):
+    image_store = get_image_store()
+    created = existing = 0
+
+    async for doc in image_store.images.select(["hash", "image_id"]).stream():
+        data = doc.to_dict()
+        file_hash = data.get("hash")
+        # Images keyed by their hash and aliases don't need an alias
+        if not file_hash or doc.id == file_hash or "image_id" in data:
+            continue
+
+        if dry_run:
+            print(f"Would index {doc.id}")
+        else:
+            try:
+                # An alias points a hash to the ID of the image it belongs to
+                await image_store.images.document(file_hash).create(
+                    {"hash": file_hash, "image_id": doc.id}
+                )
+            except AlreadyExists:
+                # A duplicate of an image that already has an alias
+                existing += 1
+                continue
+        created += 1
+        if limit and created >= limit:
+            break
+
+    print(f"Indexed {created} images, {existing} already had an alias")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--limit", type=int, help="Index at most this many images")
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Only list the images to index"
+    )
+    args = parser.parse_args()
+    asyncio.run(index(args.limit, args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
@@ -5,20 +5,93 @@ from google import genai
 from src.storage.user_store import UserStore
 from src.storage.screenplay_store import ScreenplayStore
 from src.storage.image_store import ImageStore
+from src.writing.model_gateway import ModelGateway
+from src.writing.screenplay_graph import ScreenplayGenerator
+from src.writing.template_loader import TemplateLoader
+from src.jobs.generation_queue import GenerationQueue
+from src.jobs.job_store import FirestoreJobStore, MemoryJobStore
 from fastapi.templating import Jinja2Templates
 from src.core.settings import settings
+from src.core.cache import TTLCache
+from src.core.page_cache import FilePageBackend, MemoryPageBackend, PageCache
 
 # Initialize clients
-firestore_client = firestore.Client()
+firestore_client = firestore.AsyncClient()
 storage_client = storage.Client()
 genai_client = genai.Client(
     vertexai=True, project=settings.PROJECT_ID, location=settings.GEMINI_REGION
 )
 
 # Initialize stores
-user_store = UserStore(firestore_client)
+user_store = UserStore(
+    firestore_client,
+    cache=TTLCache(maxsize=settings.USER_CACHE_SIZE, ttl=settings.USER_CACHE_TTL),
+)
 screenplay_store = ScreenplayStore(firestore_client)
-image_store = ImageStore(storage_client)
+image_store = ImageStore(storage_client, firestore_client)
+
+# Shared by all model calls in this worker, quotas are per model
+model_gateway = ModelGateway(
+    genai_client,
+    rate_limits={
+        settings.CREATIVE_MODEL: settings.CREATIVE_MODEL_RPM / 60,
+        settings.FLASH_MODEL: settings.FLASH_MODEL_RPM / 60,
+    },
+    max_concurrency=settings.MODEL_CONCURRENCY,
+    call_timeout=settings.MODEL_CALL_TIMEOUT,
+    max_retries=settings.MODEL_MAX_RETRIES,
+    failure_threshold=settings.MODEL_CIRCUIT_FAILURES,
+    reset_timeout=settings.MODEL_CIRCUIT_RESET,
+)
+
+
+def create_screenplay_generator(gateway: ModelGateway) -> ScreenplayGenerator:
+    """A generator configured by the settings, making its calls through gateway"""
+    return ScreenplayGenerator(
+        genai_client,
+        TemplateLoader(),
+        cache=(
+            TTLCache(
+                maxsize=settings.GENERATION_CACHE_SIZE,
+                ttl=settings.GENERATION_CACHE_TTL,
+            )
+            if settings.GENERATION_CACHE_ENABLED
+            else None
+        ),
+        dag=settings.GENERATION_DAG,
+        gateway=gateway,
+        structure_mode=settings.STRUCTURE_MODE,
+    )
+
+
+# Long-lived generator, the workflow graph is compiled once at startup
+screenplay_generator = create_screenplay_generator(model_gateway)
+
+# Background generation jobs, workers are started in the app lifespan
+generation_queue = GenerationQueue(
+    screenplay_generator,
+    screenplay_store,
+    concurrency=settings.GENERATION_CONCURRENCY,
+    max_queue_size=settings.GENERATION_QUEUE_SIZE,
+    job_ttl=settings.GENERATION_JOB_TTL,
+    stream_scene_text=settings.STREAM_SCENE_TEXT,
+    job_store=(
+        FirestoreJobStore(firestore_client)
+        if settings.GENERATION_JOB_BACKEND == "firestore"
+        else MemoryJobStore()
+    ),
+)
+
+# Rendered public gallery pages for anonymous visitors
+gallery_cache = PageCache(
+    (
+        FilePageBackend(settings.GALLERY_CACHE_DIR)
+        if settings.GALLERY_CACHE_DIR
+        else MemoryPageBackend()
+    ),
+    ttl=settings.GALLERY_CACHE_TTL,
+    stale_ttl=settings.GALLERY_CACHE_STALE_TTL,
+)
 
 # Templates (should be a global dependency)
 templates = Jinja2Templates(directory="templates")
@@ -28,7 +101,16 @@ templates.env.globals["is_logged_in"] = lambda request: bool(
 
 
 async def require_user(request: Request):
-    user = await request.state.get_current_user()
+    return await _require_user(request, authoritative=False)
+
+
+async def require_stored_user(request: Request):
+    """Like require_user, but never uses the snapshot in a fat session token"""
+    return await _require_user(request, authoritative=True)
+
+
+async def _require_user(request: Request, authoritative: bool):
+    user = await request.state.get_current_user(authoritative)
     if not user:
         # Get the current path to redirect back to after login
         # Get just the path and query parts of the URL for relative redirect
@@ -46,6 +128,10 @@ def get_genai_client():
     return genai_client
 
 
+def get_generation_queue():
+    return generation_queue
+
+
 def get_user_store():
     return user_store
 
@@ -58,5 +144,9 @@ def get_image_store():
     return image_store
 
 
+def get_gallery_cache():
+    return gallery_cache
+
+
 def get_templates():
     return templates
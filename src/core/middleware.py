@@ -0,0 +1,68 @@
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Room for multipart boundaries and the other form fields of an upload
+FORM_OVERHEAD_BYTES = 64 * 1024
+
+TOO_LARGE_MESSAGE = "The upload is too large"
+
+
+class BodyTooLargeError(HTTPException):
+    """Raised while a request body is read, once it passes the limit"""
+
+    def __init__(self):
+        super().__init__(status_code=413, detail=TOO_LARGE_MESSAGE)
+
+
+class BodySizeLimitMiddleware:
+    """
+    Rejects requests with a body larger than allowed. Requests that announce
+    a larger Content-Length are rejected before the body is read, the bytes
+    of other requests are counted while they are received.
+    """
+
+    def __init__(self, app: ASGIApp, max_upload_bytes: int):
+        self.app = app
+        self.max_body_bytes = max_upload_bytes + FORM_OVERHEAD_BYTES
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length", b"").decode("latin-1")
+        if content_length.isdigit() and int(content_length) > self.max_body_bytes:
+            await self._reject(scope, receive, send)
+            return
+
+        received = 0
+        response_started = False
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_bytes:
+                    raise BodyTooLargeError()
+            return message
+
+        async def tracked_send(message: Message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except BodyTooLargeError:
+            # Normally answered by the exception handlers of the app
+            if response_started:
+                raise
+            await self._reject(scope, receive, send)
+
+    async def _reject(self, scope: Scope, receive: Receive, send: Send):
+        response = JSONResponse(status_code=413, content={"detail": TOO_LARGE_MESSAGE})
+        await response(scope, receive, send)
@@ -0,0 +1,176 @@
+"""Versioned cache for rendered pages, with stale-while-revalidate."""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+from collections import OrderedDict
+from datetime import date
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+class MemoryPageBackend:
+    """Keeps cached pages in this process, bounded by the number of entries"""
+
+    def __init__(self, maxsize: int = 64):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[str, Any] = OrderedDict()
+        self._version = uuid.uuid4().hex
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def set(self, key: str, entry: Any):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def get_version(self) -> str:
+        return self._version
+
+    def new_version(self):
+        self._version = uuid.uuid4().hex
+        # Entries of older versions can never be read again
+        self._entries.clear()
+
+
+class FilePageBackend:
+    """
+    Keeps cached pages in a local directory, so all worker processes on a
+    host share them and see each other's invalidations. Pages are small, so
+    they are read and written without leaving the event loop.
+
+    Entries are stored as JSON, dates and times such as created_at come back
+    as ISO 8601 text.
+    """
+
+    VERSION_FILE = "version"
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{uuid.uuid5(uuid.NAMESPACE_URL, key).hex}.page"
+
+    def _write(self, path: Path, data: bytes):
+        # Write to a temporary file first so readers never see partial entries
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def _json_default(value: Any) -> str:
+        if isinstance(value, date):
+            return value.isoformat()
+        raise TypeError(f"{type(value).__name__} can't be cached")
+
+    def get(self, key: str) -> Optional[Any]:
+        try:
+            return json.loads(self._path(key).read_bytes())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def set(self, key: str, entry: Any):
+        data = json.dumps(entry, default=self._json_default)
+        self._write(self._path(key), data.encode())
+
+    def get_version(self) -> str:
+        try:
+            return (self.directory / self.VERSION_FILE).read_text()
+        except FileNotFoundError:
+            return ""
+
+    def new_version(self):
+        self._write(self.directory / self.VERSION_FILE, uuid.uuid4().hex.encode())
+        for path in self.directory.glob("*.page"):
+            path.unlink(missing_ok=True)
+
+
+class PageCache:
+    """
+    Cache for rendered pages and the data they were rendered from.
+
+    Keys are scoped to a version, invalidate() starts a new version so every
+    cached page misses at once. Entries are fresh for ttl seconds. For another
+    stale_ttl seconds they are still served while a single background task
+    builds a replacement.
+    """
+
+    def __init__(
+        self,
+        backend: MemoryPageBackend | FilePageBackend,
+        ttl: float = 60,
+        stale_ttl: float = 300,
+    ):
+        self.backend = backend
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._pending: Dict[str, asyncio.Task] = {}
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    async def get_or_build(
+        self, key: str, build: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """Return the cached entry for key, calling build() when needed"""
+        versioned_key = f"{self.backend.get_version()}:{key}"
+        entry = self.backend.get(versioned_key)
+        age = time.time() - entry["stored_at"] if entry else None
+
+        if entry and age < self.ttl:
+            self.hits += 1
+            return entry
+        if entry and age < self.ttl + self.stale_ttl:
+            self.stale_hits += 1
+            if versioned_key not in self._pending:
+                self._start_build(versioned_key, build)
+            return entry
+
+        self.misses += 1
+        # Requests that miss at the same time share one build
+        if versioned_key not in self._pending:
+            self._start_build(versioned_key, build)
+        return await asyncio.shield(self._pending[versioned_key])
+
+    def _start_build(self, versioned_key: str, build):
+        task = asyncio.create_task(self._build(versioned_key, build))
+        self._pending[versioned_key] = task
+        task.add_done_callback(lambda task: self._build_done(versioned_key, task))
+
+    async def _build(self, versioned_key: str, build) -> Dict[str, Any]:
+        entry = {**await build(), "stored_at": time.time()}
+        # Don't store pages that were built while the cache was invalidated
+        if versioned_key.startswith(f"{self.backend.get_version()}:"):
+            self.backend.set(versioned_key, entry)
+        return entry
+
+    def _build_done(self, versioned_key: str, task: asyncio.Task):
+        del self._pending[versioned_key]
+        if not task.cancelled() and task.exception():
+            print(f"Building a cached page failed: {task.exception()}", file=sys.stderr)
+
+    def invalidate(self):
+        """Drop all cached pages"""
+        self.backend.new_version()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit and miss counters"""
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,40 @@
+"""Rate limiting for calls to external services."""
+
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    Allows rate calls per second on average, with bursts of up to capacity
+    calls. acquire() waits until a token is available. Tokens are handed out
+    in the order they were requested.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated_at) * self.rate
+        )
+        self._updated_at = now
+
+    async def acquire(self, tokens: float = 1):
+        """Wait until tokens are available and take them"""
+        async with self._lock:
+            self._refill()
+            while self._tokens < tokens:
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= tokens
+
+    def drain(self):
+        """Drop the available tokens, e.g. after the service reported overload"""
+        self._refill()
+        self._tokens = min(self._tokens, 0)
@@ -1,5 +1,6 @@
 from pydantic_settings import BaseSettings
 from pydantic import Field
+from typing import Optional
 
 
 class Settings(BaseSettings):
@@ -14,9 +15,64 @@ class Settings(BaseSettings):
         ...,
         description="Google OAuth client ID",
     )
+    STORAGE_MAX_WORKERS: int = Field(
+        8, description="Maximum number of concurrent Cloud Storage calls"
+    )
+    IMAGE_WORKERS: int = Field(
+        2, description="Number of worker processes that decode and resize images"
+    )
+    IMAGE_QUEUE_SIZE: int = Field(
+        16, description="Maximum number of images waiting for an image worker"
+    )
+    IMAGE_TIMEOUT: float = Field(
+        30, description="Seconds to wait for an image to be processed"
+    )
+    IMAGE_MAX_PIXELS: int = Field(
+        50_000_000, description="Maximum number of pixels in an uploaded image"
+    )
+    UPLOAD_MAX_BYTES: int = Field(
+        25 * 1024 * 1024, description="Maximum size in bytes of an uploaded image"
+    )
+    IMAGE_CACHE_BYTES: int = Field(
+        64 * 1024 * 1024, description="Memory budget in bytes for cached images"
+    )
+    IMAGE_CACHE_DIR: Optional[str] = Field(
+        None, description="Directory for the on-disk image cache, disabled if unset"
+    )
+    IMAGE_CACHE_DISK_BYTES: int = Field(
+        1024 * 1024 * 1024, description="Disk budget in bytes for cached images"
+    )
+    IMAGE_STREAM_CHUNK_BYTES: int = Field(
+        256 * 1024, description="Chunk size in bytes for streaming image responses"
+    )
     JWT_SECRET: str = Field(..., description="Secret key for JWT tokens")
     JWT_ALGORITHM: str = Field("HS256", description="Algorithm for JWT tokens")
     TOKEN_EXPIRE_DAYS: int = Field(30, description="JWT token expiration in days")
+    FAT_SESSION: bool = Field(
+        False,
+        description="Store the user's name, picture and email in the session token",
+    )
+    SESSION_VERSION: int = Field(
+        1, description="Version of the user snapshot in session tokens"
+    )
+    GALLERY_CACHE_PAGES: int = Field(
+        3, description="Number of public gallery pages to cache, 0 disables it"
+    )
+    GALLERY_CACHE_TTL: int = Field(
+        60, description="Seconds a cached gallery page is served as fresh"
+    )
+    GALLERY_CACHE_STALE_TTL: int = Field(
+        300,
+        description="Seconds a cached gallery page is served while it is refreshed",
+    )
+    GALLERY_CACHE_DIR: Optional[str] = Field(
+        None,
+        description="Directory to share cached gallery pages between processes",
+    )
+    USER_CACHE_SIZE: int = Field(
+        1000, description="Maximum number of user records cached in memory"
+    )
+    USER_CACHE_TTL: int = Field(60, description="Seconds to keep a cached user record")
     CREATIVE_MODEL: str = Field(
         "gemini-2.0-pro-exp-02-05",
         description="Model to use for creative generation tasks",
@@ -25,6 +81,72 @@ class Settings(BaseSettings):
         "gemini-2.0-flash-001",
         description="Model to use for fast, structured generation tasks",
     )
+    CREATIVE_MODEL_RPM: float = Field(
+        0, description="Maximum calls per minute to the creative model, 0 for no limit"
+    )
+    FLASH_MODEL_RPM: float = Field(
+        0, description="Maximum calls per minute to the Flash model, 0 for no limit"
+    )
+    MODEL_CONCURRENCY: int = Field(
+        16, description="Maximum number of model calls in flight per worker"
+    )
+    MODEL_CALL_TIMEOUT: float = Field(
+        120, description="Seconds to wait for a single model call attempt"
+    )
+    MODEL_MAX_RETRIES: int = Field(
+        4, description="Retries for a model call that was throttled or failed"
+    )
+    MODEL_CIRCUIT_FAILURES: int = Field(
+        5, description="Consecutive failures after which a model isn't called"
+    )
+    MODEL_CIRCUIT_RESET: float = Field(
+        30, description="Seconds before a model is tried again after failures"
+    )
+    GENERATION_DEADLINE: float = Field(
+        300, description="Seconds a screenplay generation may take, retries included"
+    )
+    GENERATION_DAG: bool = Field(
+        False,
+        description="Detect the genre while the image is analyzed, and store "
+        "uploaded images while the screenplay is generated",
+    )
+    STRUCTURE_MODE: str = Field(
+        "llm",
+        description="How the scene is structured: llm for a second pass with the "
+        "Flash model, json to have the creative model write JSON, or parse for "
+        "a local parser that falls back to the Flash model",
+    )
+    GENERATION_CONCURRENCY: int = Field(
+        4, description="Number of screenplays generated concurrently per worker"
+    )
+    GENERATION_QUEUE_SIZE: int = Field(
+        32, description="Maximum number of generation jobs waiting in the queue"
+    )
+    GENERATION_JOB_TTL: int = Field(
+        600, description="Seconds to keep finished generation jobs for status polls"
+    )
+    GENERATION_JOB_BACKEND: str = Field(
+        "firestore",
+        description="Where generation job state is kept for status polls: "
+        "firestore, shared by all instances, or memory for a single instance",
+    )
+    GENERATION_DRAIN_TIMEOUT: float = Field(
+        8, description="Seconds running generation jobs may finish on shutdown"
+    )
+    STREAM_SCENE_TEXT: bool = Field(
+        True, description="Stream the scene text to the browser while it is written"
+    )
+    GENERATION_CACHE_ENABLED: bool = Field(
+        False,
+        description="Reuse generated screenplays for re-uploaded images, "
+        "instead of writing a new one each time",
+    )
+    GENERATION_CACHE_SIZE: int = Field(
+        1000, description="Maximum number of cached generation results"
+    )
+    GENERATION_CACHE_TTL: int = Field(
+        86400, description="Seconds to keep a cached generation result"
+    )
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,289 @@
+import asyncio
+import sys
+import time
+import uuid
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any, Dict, Optional
+from src.jobs.job_store import JOB_RECORD_FIELDS, JobStore, MemoryJobStore
+from src.storage.screenplay_store import ScreenplayStore
+from src.writing.model_gateway import ModelUnavailableError
+from src.writing.screenplay_graph import ScreenplayGenerator
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+@dataclass
+class GenerationJob:
+    """A screenplay generation request waiting for, or handled by, a worker"""
+
+    user_id: str
+    image_id: str
+    image_data: bytes
+    use_cache: bool = True
+    author: Optional[dict] = None
+    # Completes when the uploaded image is stored, if that is still going on
+    image_stored: Optional[asyncio.Future] = field(default=None, repr=False)
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: JobStatus = JobStatus.QUEUED
+    screenplay_id: Optional[str] = None
+    error: Optional[str] = None
+    finished_at: Optional[float] = None
+    scene_text: list[str] = field(default_factory=list)
+    timings: dict[str, float] = field(default_factory=dict)
+    _updated: asyncio.Event = field(
+        default_factory=asyncio.Event, init=False, repr=False
+    )
+    _save_lock: asyncio.Lock = field(
+        default_factory=asyncio.Lock, init=False, repr=False
+    )
+
+    @classmethod
+    def from_record(cls, job_id: str, record: Dict[str, Any]) -> "GenerationJob":
+        """A job as stored by another instance, without its image and scene text"""
+        return cls(
+            id=job_id,
+            user_id=record["user_id"],
+            image_id=record["image_id"],
+            image_data=b"",
+            status=JobStatus(record["status"]),
+            screenplay_id=record.get("screenplay_id"),
+            error=record.get("error"),
+        )
+
+    def to_record(self) -> Dict[str, Any]:
+        """The fields that are kept in a job store"""
+        record = {field: getattr(self, field) for field in JOB_RECORD_FIELDS}
+        record["status"] = self.status.value
+        return record
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (JobStatus.DONE, JobStatus.FAILED)
+
+    def add_scene_text(self, text: str):
+        """Record a chunk of streamed scene text and wake up listeners"""
+        self.scene_text.append(text)
+        self.notify()
+
+    def notify(self):
+        """Wake up everyone waiting for an update on this job"""
+        self._updated.set()
+        self._updated = asyncio.Event()
+
+    async def wait_for_update(self, timeout: float) -> bool:
+        """Wait until the job changes, returns False on timeout"""
+        try:
+            await asyncio.wait_for(self._updated.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+
+class GenerationQueue:
+    """
+    In-process job queue for screenplay generation.
+
+    A fixed number of async workers take jobs from a bounded queue, run the
+    ScreenplayGenerator pipeline and store the result. Jobs of this process
+    are kept in memory, with the streamed scene text. Their state is also
+    saved to job_store for job_ttl seconds, so other instances can answer
+    status polls for them.
+    """
+
+    def __init__(
+        self,
+        generator: ScreenplayGenerator,
+        screenplay_store: ScreenplayStore,
+        concurrency: int = 4,
+        max_queue_size: int = 32,
+        job_ttl: int = 600,
+        stream_scene_text: bool = True,
+        job_store: Optional[JobStore] = None,
+    ):
+        self.generator = generator
+        self.screenplay_store = screenplay_store
+        self.concurrency = concurrency
+        self.job_ttl = job_ttl
+        self.stream_scene_text = stream_scene_text
+        self.job_store = job_store or MemoryJobStore()
+        self._stopping = False
+        self._queue: asyncio.Queue[GenerationJob] = asyncio.Queue(
+            maxsize=max_queue_size
+        )
+        self._jobs: Dict[str, GenerationJob] = {}
+        self._workers: list[asyncio.Task] = []
+
+    def start(self):
+        """Start the worker tasks, must be called from within the event loop"""
+        if self._workers:
+            return
+        self._workers = [
+            asyncio.create_task(self._worker()) for _ in range(self.concurrency)
+        ]
+
+    async def stop(self, timeout: float = 0):
+        """
+        Stop taking jobs and give the queued and running ones up to timeout
+        seconds to finish. The workers are cancelled after that, and jobs
+        that didn't finish are marked failed in the job store.
+        """
+        self._stopping = True
+        if self._workers and timeout > 0:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+        unfinished = [job for job in self._jobs.values() if not job.finished]
+        for job in unfinished:
+            job.status = JobStatus.FAILED
+            job.error = "The server restarted, please try again"
+            job.image_data = b""
+            job.finished_at = time.monotonic()
+            job.notify()
+        await asyncio.gather(*map(self._save, unfinished))
+
+    def is_full(self) -> bool:
+        """True if a submitted job would be rejected"""
+        return self._stopping or self._queue.full()
+
+    async def submit(
+        self,
+        user_id: str,
+        image_id: str,
+        image_data: bytes,
+        use_cache: bool = True,
+        author: Optional[dict] = None,
+        image_stored: Optional[asyncio.Future] = None,
+    ) -> GenerationJob:
+        """
+        Queue a generation job and return it without waiting for the result.
+        When image_stored is given, the screenplay is stored once it completes.
+        Raises QueueFullError if the queue has no room left.
+        """
+        if self._stopping:
+            raise QueueFullError("The server is shutting down")
+        self._prune_finished_jobs()
+
+        job = GenerationJob(
+            user_id=user_id,
+            image_id=image_id,
+            image_data=image_data,
+            use_cache=use_cache,
+            author=author,
+            image_stored=image_stored,
+        )
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFullError("Too many screenplays are being generated")
+
+        self._jobs[job.id] = job
+        await self._save(job)
+        return job
+
+    async def get_job(self, job_id: str) -> Optional[GenerationJob]:
+        """Look up a job by its ID, in this process or in the job store"""
+        job = self._jobs.get(job_id)
+        if job:
+            return job
+        record = await self.job_store.get(job_id)
+        return GenerationJob.from_record(job_id, record) if record else None
+
+    def is_local(self, job: GenerationJob) -> bool:
+        """True if the job runs in this process, so it streams updates"""
+        return self._jobs.get(job.id) is job
+
+    async def _save(self, job: GenerationJob):
+        """Save the current state of a job to the job store"""
+        # Saves of a job are serialized, so the last one has the latest state
+        async with job._save_lock:
+            try:
+                await self.job_store.save(job.id, job.to_record(), self.job_ttl)
+            except Exception as e:
+                print(f"Saving job {job.id} failed: {str(e)}", file=sys.stderr)
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run_job(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run_job(self, job: GenerationJob):
+        job.status = JobStatus.RUNNING
+        job.notify()
+        await self._save(job)
+        try:
+            final_state = await self.generator.generate_from_image(
+                job.image_data,
+                on_scene_text=job.add_scene_text if self.stream_scene_text else None,
+                use_cache=job.use_cache,
+            )
+
+            job.timings = final_state.get("timings", {})
+
+            # The screenplay may only refer to an image that is stored
+            if job.image_stored:
+                await job.image_stored
+
+            screenplay_data = {
+                "user_id": job.user_id,
+                "raw_scene": final_state["scene"],
+                "structured_scene": final_state["structured_scene"].model_dump(),
+                "genre": final_state["genre"],
+                "models": final_state["models"],
+                "analysis": final_state.get("analysis"),
+            }
+            job.screenplay_id = await self.screenplay_store.store_screenplay(
+                screenplay_data, job.image_id, author=job.author
+            )
+            job.status = JobStatus.DONE
+        except ModelUnavailableError as e:
+            print(f"Screenplay generation failed: {str(e)}", file=sys.stderr)
+            job.error = "The writers are busy right now, please try again in a minute"
+            job.status = JobStatus.FAILED
+        except Exception as e:
+            print(f"Screenplay generation failed: {str(e)}", file=sys.stderr)
+            job.error = "Screenplay generation failed, please try again"
+            job.status = JobStatus.FAILED
+        finally:
+            if job.image_stored:
+                # Also when generation failed, the stored image can be used
+                # for the next attempt. Failures are logged by the task.
+                await asyncio.wait([job.image_stored])
+            # The image is not needed anymore once the job has finished
+            job.image_data = b""
+            job.finished_at = time.monotonic()
+            job.notify()
+        if job.timings:
+            stages = ", ".join(f"{k} {v:.2f}s" for k, v in job.timings.items())
+            print(f"Job {job.id} {job.status.value}: {stages}", file=sys.stderr)
+        await self._save(job)
+
+    def _prune_finished_jobs(self):
+        """Forget finished jobs older than job_ttl"""
+        cutoff = time.monotonic() - self.job_ttl
+        expired = [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job.finished and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
@@ -0,0 +1,75 @@
+"""Backends that keep the state of generation jobs for status polls."""
+
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+from google.cloud import firestore
+
+# Job fields that are kept in a job store, see GenerationJob.to_record()
+JOB_RECORD_FIELDS = ("user_id", "image_id", "status", "screenplay_id", "error")
+
+
+class JobStore(ABC):
+    """
+    Keeps the state of generation jobs, so a status poll that reaches
+    another instance than the one running the job can still be answered.
+    """
+
+    @abstractmethod
+    async def save(self, job_id: str, record: Dict[str, Any], ttl: float):
+        """Store the state of a job, it can be forgotten after ttl seconds"""
+
+    @abstractmethod
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """The stored state of a job, None if it is unknown or expired"""
+
+
+class MemoryJobStore(JobStore):
+    """Keeps job state in this process, for a single instance and for tests"""
+
+    def __init__(self):
+        self._records: Dict[str, tuple[float, Dict[str, Any]]] = {}
+
+    async def save(self, job_id: str, record: Dict[str, Any], ttl: float):
+        now = time.monotonic()
+        # Forget expired jobs on the way, so memory use stays bounded
+        expired = [
+            key for key, (expires_at, _) in self._records.items() if expires_at < now
+        ]
+        for key in expired:
+            del self._records[key]
+        self._records[job_id] = (now + ttl, dict(record))
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        expires_at, record = self._records.get(job_id, (0, None))
+        if record is None or expires_at < time.monotonic():
+            return None
+        return dict(record)
+
+
+class FirestoreJobStore(JobStore):
+    """
+    Keeps job state in Firestore, shared by all instances. Documents carry
+    an expire_at field, configure a TTL policy on it to have Firestore
+    delete expired jobs.
+    """
+
+    def __init__(self, db: firestore.AsyncClient, collection: str = "generation_jobs"):
+        self.jobs = db.collection(collection)
+
+    async def save(self, job_id: str, record: Dict[str, Any], ttl: float):
+        now = datetime.now(timezone.utc)
+        await self.jobs.document(job_id).set(
+            {**record, "updated_at": now, "expire_at": now + timedelta(seconds=ttl)}
+        )
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        doc = await self.jobs.document(job_id).get()
+        if not doc.exists:
+            return None
+        data = doc.to_dict()
+        # The TTL policy deletes documents some time after they expire
+        if data["expire_at"] < datetime.now(timezone.utc):
+            return None
+        return {field: data.get(field) for field in JOB_RECORD_FIELDS}
@@ -4,7 +4,7 @@ from fastapi.responses import JSONResponse, HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 from typing import Annotated
 from src.core.dependencies import get_user_store, UserStore, get_templates, require_user
-from src.auth.jwt import create_jwt_token
+from src.auth.jwt import create_session_token, session_expiry, set_session_cookie
 from src.core.settings import settings
 
 router = APIRouter()
@@ -37,22 +37,18 @@ async def verify_token(
         # Verify token and store user
         user_id = await user_store.create_or_update_user(token)
 
-        # Create JWT token
-        jwt_token = create_jwt_token({"user_id": user_id})
+        # The user record is only needed for the snapshot in fat sessions
+        user = {"id": user_id}
+        if settings.FAT_SESSION:
+            user = await user_store.get_user_by_id(user_id)
 
-        # Calculate max_age in seconds to match JWT expiry
-        max_age = settings.TOKEN_EXPIRE_DAYS * 24 * 60 * 60 - 60
+        # Create JWT token
+        expires_at = session_expiry()
+        jwt_token = create_session_token(user, expires_at)
 
         # Create response with secure cookie
         response = JSONResponse(content={"status": "success"})
-        response.set_cookie(
-            key="session_token",
-            value=jwt_token,
-            httponly=True,
-            secure=True,
-            samesite="Lax",
-            max_age=max_age,
-        )
+        set_session_cookie(response, jwt_token, expires_at)
 
         return response
 
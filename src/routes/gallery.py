@@ -2,7 +2,14 @@ from fastapi import APIRouter, Request, Response, Depends, HTTPException
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 from typing import Annotated
-from src.core.dependencies import get_screenplay_store, get_templates
+from src.core.dependencies import (
+    get_gallery_cache,
+    get_screenplay_store,
+    get_templates,
+)
+from src.core.page_cache import PageCache
+from src.core.settings import settings
+from src.storage.cursors import InvalidCursorError, decode_cursor
 from src.storage.screenplay_store import ScreenplayStore
 
 router = APIRouter()
@@ -13,31 +20,47 @@ async def gallery(
     request: Request,
     screenplay_store: Annotated[ScreenplayStore, Depends(get_screenplay_store)],
     templates: Annotated[Jinja2Templates, Depends(get_templates)],
-    page_starts_at: str = None,
+    gallery_cache: Annotated[PageCache, Depends(get_gallery_cache)],
+    cursor: str = None,
+    page: int = 1,
 ):
     """Show paginated gallery of screenplays"""
     page_size = 12
-    screenplays, next_page_start = await screenplay_store.get_paginated_screenplays(
-        page_size=page_size, page_starts_at=page_starts_at, public_only=True
-    )
+    if page < 1:
+        raise HTTPException(status_code=400, detail="Invalid page number")
+    if cursor:
+        try:
+            decode_cursor(cursor)
+        except InvalidCursorError:
+            raise HTTPException(status_code=400, detail="Invalid page cursor")
 
-    # If page_starts_at is provided, return only the gallery items
-    if page_starts_at:
-        return templates.TemplateResponse(
-            "gallery_items.html",
+    # If a cursor is provided, return only the gallery items
+    # Otherwise return the full gallery page
+    template_name = "gallery_items.html" if cursor else "index.html"
+
+    async def render_page():
+        screenplays, next_cursor = await screenplay_store.get_paginated_screenplays(
+            page_size=page_size, cursor=cursor, public_only=True
+        )
+        html = templates.get_template(template_name).render(
             {
                 "request": request,
                 "screenplays": screenplays,
-                "next_page_start": next_page_start,
-            },
+                "next_cursor": next_cursor,
+                "page": page,
+            }
         )
+        return {"screenplays": screenplays, "next_cursor": next_cursor, "html": html}
 
-    # Otherwise return the full gallery page
-    return templates.TemplateResponse(
-        "index.html",
-        {
-            "request": request,
-            "screenplays": screenplays,
-            "next_page_start": next_page_start,
-        },
-    )
+    # Anonymous visitors all get the same first pages, serve them from cache.
+    # The page number is rendered into the page, so it is part of the key.
+    if page <= settings.GALLERY_CACHE_PAGES and not request.cookies.get(
+        "session_token"
+    ):
+        rendered = await gallery_cache.get_or_build(
+            f"{template_name}:{page}:{cursor or ''}", render_page
+        )
+    else:
+        rendered = await render_page()
+
+    return HTMLResponse(rendered["html"])
@@ -1,20 +1,146 @@
-from fastapi import APIRouter, Response, Depends, HTTPException
-from typing import Annotated
+from fastapi import APIRouter, Request, Response, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from google.cloud.exceptions import NotFound
+from typing import Annotated, Optional
 from src.core.dependencies import get_image_store
+from src.storage.image_processing import IMAGE_FORMATS, IMAGE_SIZES
 from src.storage.image_store import ImageStore
 
 router = APIRouter()
 
+# Formats to offer in order of preference, JPEG is the fallback
+NEGOTIATED_FORMATS = [fmt for fmt in ("avif", "webp") if fmt in IMAGE_FORMATS]
+
+# Stored images never change, so browsers and CDNs can keep them forever
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+# The full JPEG served in place of a missing derivative is replaced by the
+# derivative once it is made, so it may only be kept for a while
+FALLBACK_CACHE_CONTROL = "public, max-age=300"
+
+
+class RangeNotSatisfiable(Exception):
+    """Raised when a Range header doesn't overlap with the content"""
+
+
+def negotiate_format(accept: str) -> str:
+    """Pick the best image format the client accepts"""
+    for image_format in NEGOTIATED_FORMATS:
+        content_type, _ = IMAGE_FORMATS[image_format]
+        if content_type in accept:
+            return image_format
+    return "jpeg"
+
+
+def image_etag(image_id: str, size: str, image_format: str) -> str:
+    """
+    Strong ETag for a stored image. Image IDs are assigned per content hash
+    and stored images are never overwritten, so the ID and variant identify
+    the exact bytes.
+    """
+    return f'"{image_id}-{size}-{image_format}"'
+
+
+def etag_matches(if_none_match: str, etags: list[str]) -> bool:
+    """Check an If-None-Match header against the ETags of a resource"""
+    if if_none_match.strip() == "*":
+        return True
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return any(etag in candidates for etag in etags)
+
+
+def parse_range(range_header: str, length: int) -> Optional[tuple[int, int]]:
+    """
+    Parse a single byte range, returns inclusive (start, end) or None when the
+    header should be ignored. Raises RangeNotSatisfiable if the range is
+    outside the content.
+    """
+    unit, _, ranges = range_header.partition("=")
+    if unit.strip() != "bytes" or "," in ranges:
+        # Multiple ranges are not supported, send the whole image instead
+        return None
+
+    start, _, end = ranges.strip().partition("-")
+    try:
+        if not start:
+            # Suffix range, the last N bytes
+            suffix = int(end)
+            if suffix <= 0:
+                raise RangeNotSatisfiable()
+            return max(0, length - suffix), length - 1
+        first = int(start)
+        last = int(end) if end else length - 1
+    except ValueError:
+        return None
+
+    if first >= length or last < first:
+        raise RangeNotSatisfiable()
+    return first, min(last, length - 1)
+
 
 @router.get("/{image_id}")
 async def get_image(
+    request: Request,
     image_id: str,
     image_store: Annotated[ImageStore, Depends(get_image_store)],
+    size: str = "full",
 ):
     """Serve images directly from Cloud Storage"""
+    if size not in IMAGE_SIZES:
+        raise HTTPException(status_code=400, detail="Unknown image size")
+
+    image_format = negotiate_format(request.headers.get("accept", ""))
+    headers = {"Cache-Control": CACHE_CONTROL, "Vary": "Accept"}
+
+    # Answer revalidation without touching storage
+    etag = image_etag(image_id, size, image_format)
+    headers["ETag"] = etag
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, [etag]):
+        return Response(status_code=304, headers=headers)
+
     try:
-        blob = image_store.get_image_blob(image_id)
-        image_bytes = blob.download_as_bytes()
-        return Response(content=image_bytes, media_type="image/jpeg")
+        try:
+            image = await image_store.open_image(image_id, size, image_format)
+        except NotFound:
+            # Images uploaded before derivatives existed only have a full JPEG
+            if (size, image_format) == ("full", "jpeg"):
+                raise
+            image_format = "jpeg"
+            image = await image_store.open_image(image_id)
+            etag = image_etag(image_id, "full", "jpeg")
+            headers["ETag"] = etag
+            headers["Cache-Control"] = FALLBACK_CACHE_CONTROL
     except Exception as e:
         raise HTTPException(status_code=404, detail="Image not found")
+
+    # Clients may hold the full JPEG fallback, it is still current
+    if if_none_match and etag_matches(if_none_match, [etag]):
+        return Response(status_code=304, headers=headers)
+
+    content_type, _ = IMAGE_FORMATS[image_format]
+    headers["Accept-Ranges"] = "bytes"
+
+    # Serve a partial response, unless If-Range says the client's copy is stale
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range.strip() == etag):
+        try:
+            byte_range = parse_range(range_header, image.length)
+        except RangeNotSatisfiable:
+            return Response(
+                status_code=416, headers={"Content-Range": f"bytes */{image.length}"}
+            )
+        if byte_range:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{image.length}"
+            headers["Content-Length"] = str(end - start + 1)
+            return StreamingResponse(
+                image.chunks(start, end),
+                status_code=206,
+                media_type=content_type,
+                headers=headers,
+            )
+
+    # Stream the image in chunks instead of buffering a copy per request
+    headers["Content-Length"] = str(image.length)
+    return StreamingResponse(image.chunks(), media_type=content_type, headers=headers)
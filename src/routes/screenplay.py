@@ -1,25 +1,44 @@
+import asyncio
+import json
+import time
 from fastapi import APIRouter, Request, Form, HTTPException, Response, Depends
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from typing import Annotated
 from src.core.dependencies import (
+    get_gallery_cache,
     get_screenplay_store,
     get_templates,
     get_image_store,
-    get_genai_client,
+    get_generation_queue,
     get_user_store,
+    require_stored_user,
     require_user,
 )
+from src.core.page_cache import PageCache
+from src.core.settings import settings
+from src.storage.cursors import InvalidCursorError
 from src.storage.screenplay_store import ScreenplayStore
 from src.storage.user_store import UserStore
 from src.storage.image_store import ImageStore
+from src.storage.image_upload import ingest_upload
+from src.storage.image_processing import (
+    ImageProcessingError,
+    ImageProcessingTimeoutError,
+    ImageTooLargeError,
+    ImageWorkersBusyError,
+)
 from fastapi import UploadFile, File
-from src.writing.template_loader import TemplateLoader
-from google import genai
-from src.writing.screenplay_graph import ScreenplayGenerator
+from src.jobs.generation_queue import GenerationQueue, JobStatus, QueueFullError
 
 router = APIRouter()
-prompt_templates = TemplateLoader()
+
+QUEUE_FULL_MESSAGE = (
+    "Too many screenplays are being written right now, please try again in a minute"
+)
+
+# Seconds between status checks of a job that runs on another instance
+JOB_POLL_INTERVAL = 2
 
 
 @router.get("/new", response_class=HTMLResponse)
@@ -40,13 +59,21 @@ async def view_screenplay(
     templates: Annotated[Jinja2Templates, Depends(get_templates)],
 ):
     """Serve a stored screenplay by its ID"""
-    screenplay = await screenplay_store.get_screenplay(screenplay_id)
-    screenplay_user = await user_store.get_user_by_id(screenplay["user_id"])
+    # Get the screenplay and the current user, if logged in, at the same time
+    screenplay, user = await asyncio.gather(
+        screenplay_store.get_screenplay(screenplay_id),
+        request.state.get_current_user(),
+    )
     if not screenplay:
         raise HTTPException(status_code=404, detail="Screenplay not found")
 
-    # Get current user if logged in
-    user = await request.state.get_current_user()
+    # Screenplays stored before author snapshots need a user lookup
+    screenplay_user = screenplay.get("author")
+    if screenplay_user is None:
+        if user and user["id"] == screenplay["user_id"]:
+            screenplay_user = user
+        else:
+            screenplay_user = await user_store.get_user_by_id(screenplay["user_id"])
 
     return templates.TemplateResponse(
         "screenplay_view.html",
@@ -60,55 +87,146 @@ async def view_screenplay(
     )
 
 
-@router.post("/generate")
+@router.post("/generate", response_class=HTMLResponse)
 async def generate_screenplay(
     request: Request,
-    user: Annotated[dict, Depends(require_user)],
+    user: Annotated[dict, Depends(require_stored_user)],
     image_store: Annotated[ImageStore, Depends(get_image_store)],
-    screenplay_store: Annotated[ScreenplayStore, Depends(get_screenplay_store)],
-    genai_client: Annotated[genai.Client, Depends(get_genai_client)],
+    generation_queue: Annotated[GenerationQueue, Depends(get_generation_queue)],
+    templates: Annotated[Jinja2Templates, Depends(get_templates)],
     file: UploadFile = File(...),
+    fresh: Annotated[bool, Form()] = False,
 ):
-    # Validate file type
-    if file.content_type not in [
-        "image/jpeg",
-        "image/png",
-        "image/gif",
-        "image/heic",
-        "image/heif",
-    ]:
+    # Reject early when the queue is full, before doing any work on the image
+    if generation_queue.is_full():
+        raise HTTPException(status_code=429, detail=QUEUE_FULL_MESSAGE)
+
+    # Check the upload in chunks, then process it. The file type is sniffed
+    # from its first bytes, the type the browser declares is not trusted.
+    try:
+        upload = await ingest_upload(
+            file,
+            max_bytes=settings.UPLOAD_MAX_BYTES,
+            max_pixels=settings.IMAGE_MAX_PIXELS,
+        )
+        image = await image_store.prepare_image(
+            upload.data, upload.content_type, upload.file_hash
+        )
+        if not settings.GENERATION_DAG:
+            await image_store.store_prepared_image(image)
+    except ImageTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except (ImageWorkersBusyError, ImageProcessingTimeoutError):
         raise HTTPException(
-            status_code=400,
-            detail="Only JPEG, PNG, GIF and HEIC/HEIF images are allowed",
+            status_code=503, detail="The server is busy, please try again later"
+        )
+    except ImageProcessingError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # In DAG mode the image is stored while the screenplay is generated
+    image_stored = None
+    if settings.GENERATION_DAG:
+        image_stored = image_store.store_prepared_image_in_background(image)
+
+    # Queue the screenplay generation, the client polls the job status
+    job = None
+    try:
+        job = await generation_queue.submit(
+            user["id"],
+            image.image_id,
+            image.image_data,
+            use_cache=not fresh,
+            author=user,
+            image_stored=image_stored,
         )
+    except QueueFullError:
+        raise HTTPException(status_code=429, detail=QUEUE_FULL_MESSAGE)
+    finally:
+        if image_stored and not job:
+            # Finish storing the image, it can be used for the next attempt
+            await asyncio.wait([image_stored])
+
+    return templates.TemplateResponse(
+        "job_status.html",
+        {
+            "request": request,
+            "job": job,
+            "stream_scene_text": generation_queue.stream_scene_text,
+        },
+    )
+
+
+@router.get("/jobs/{job_id}", response_class=HTMLResponse)
+async def generation_job_status(
+    request: Request,
+    job_id: str,
+    user: Annotated[dict, Depends(require_user)],
+    generation_queue: Annotated[GenerationQueue, Depends(get_generation_queue)],
+    templates: Annotated[Jinja2Templates, Depends(get_templates)],
+):
+    """Report the status of a generation job, redirects when it is done"""
+    job = await generation_queue.get_job(job_id)
+    if not job or job.user_id != user["id"]:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    if job.status == JobStatus.DONE:
+        # Return a response with HX-Redirect header
+        response = Response()
+        response.headers["HX-Redirect"] = f"/screenplay/{job.screenplay_id}"
+        return response
 
-    # Read and store the image first
-    image_contents = await file.read()
-    image_id, resized_image = await image_store.process_and_store_image(
-        image_contents, file.content_type
+    return templates.TemplateResponse(
+        "job_status_message.html", {"request": request, "job": job}
     )
 
-    # Generate the screenplay
-    generator = ScreenplayGenerator(genai_client)
-    final_state = await generator.generate_from_image(resized_image)
 
-    # Store the screenplay
-    screenplay_data = {
-        "user_id": user["id"],
-        "raw_scene": final_state["scene"],
-        "structured_scene": final_state["structured_scene"].model_dump(),
-        "genre": final_state["genre"],
-        "models": final_state["models"],
-        "analysis": final_state.get("analysis"),
-    }
+@router.get("/jobs/{job_id}/events")
+async def generation_job_events(
+    job_id: str,
+    user: Annotated[dict, Depends(require_user)],
+    generation_queue: Annotated[GenerationQueue, Depends(get_generation_queue)],
+):
+    """Stream the scene text of a generation job as Server-Sent Events"""
+    job = await generation_queue.get_job(job_id)
+    if not job or job.user_id != user["id"]:
+        raise HTTPException(status_code=404, detail="Job not found")
 
-    # Store the screenplay with reference to the image
-    screenplay_id = await screenplay_store.store_screenplay(screenplay_data, image_id)
+    async def events():
+        nonlocal job
+        sent = 0
+        keepalive_at = time.monotonic() + 15
+        while True:
+            # Send everything that was written since the last event
+            for text in job.scene_text[sent:]:
+                yield f"event: scene\ndata: {json.dumps(text)}\n\n"
+                sent += 1
 
-    # Return a response with HX-Redirect header
-    response = Response()
-    response.headers["HX-Redirect"] = f"/screenplay/{screenplay_id}"
-    return response
+            if job.status == JobStatus.DONE:
+                yield f"event: done\ndata: /screenplay/{job.screenplay_id}\n\n"
+                return
+            if job.status == JobStatus.FAILED:
+                yield f"event: failed\ndata: {json.dumps(job.error)}\n\n"
+                return
+
+            if generation_queue.is_local(job):
+                updated = await job.wait_for_update(timeout=15)
+            else:
+                # The job runs on another instance, only its status is shared
+                await asyncio.sleep(JOB_POLL_INTERVAL)
+                job = await generation_queue.get_job(job_id) or job
+                updated = job.finished
+            if updated:
+                keepalive_at = time.monotonic() + 15
+            elif time.monotonic() >= keepalive_at:
+                # Keep the connection alive through proxies
+                keepalive_at = time.monotonic() + 15
+                yield ": keepalive\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.patch("/{screenplay_id}/settings")
@@ -116,6 +234,7 @@ async def update_screenplay_settings(
     screenplay_id: str,
     user: Annotated[dict, Depends(require_user)],
     screenplay_store: Annotated[ScreenplayStore, Depends(get_screenplay_store)],
+    gallery_cache: Annotated[PageCache, Depends(get_gallery_cache)],
     public: Annotated[bool, Form()] = False,
 ):
     """Update screenplay settings from form data if user owns it"""
@@ -129,6 +248,9 @@ async def update_screenplay_settings(
             status_code=404, detail="Screenplay not found or not authorized"
         )
 
+    # The screenplay may have been added to or removed from the public gallery
+    gallery_cache.invalidate()
+
     return {"status": "success"}
 
 
@@ -138,22 +260,25 @@ async def user_screenplays(
     user: Annotated[dict, Depends(require_user)],
     screenplay_store: Annotated[ScreenplayStore, Depends(get_screenplay_store)],
     templates: Annotated[Jinja2Templates, Depends(get_templates)],
-    page_starts_at: str = None,
+    cursor: str = None,
 ):
     """Show all screenplays for the logged in user"""
     page_size = 12
-    screenplays, next_page_start = await screenplay_store.get_paginated_screenplays(
-        page_size=page_size,
-        page_starts_at=page_starts_at,
-        public_only=False,
-        user_id=user["id"],
-    )
+    try:
+        screenplays, next_cursor = await screenplay_store.get_paginated_screenplays(
+            page_size=page_size,
+            cursor=cursor,
+            public_only=False,
+            user_id=user["id"],
+        )
+    except InvalidCursorError:
+        raise HTTPException(status_code=400, detail="Invalid page cursor")
 
     return templates.TemplateResponse(
         "user_screenplays.html",
         {
             "request": request,
             "screenplays": screenplays,
-            "next_page_start": next_page_start,
+            "next_cursor": next_cursor,
         },
     )
@@ -0,0 +1,46 @@
+"""Opaque, signed cursors for paginated Firestore listings."""
+
+import base64
+import hashlib
+import hmac
+import json
+from datetime import datetime, timezone
+from src.core.settings import settings
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a cursor is malformed or its signature doesn't match"""
+
+
+def _signature(payload: bytes) -> str:
+    # Derive a separate key so a cursor signature can never pass as a JWT one
+    key = hmac.new(settings.JWT_SECRET.encode(), b"cursor", hashlib.sha256).digest()
+    digest = hmac.new(key, payload, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest[:16]).decode().rstrip("=")
+
+
+def encode_cursor(created_at: datetime, doc_id: str) -> str:
+    """Encode the position after a document as an opaque cursor"""
+    micros = int(created_at.timestamp()) * 1_000_000 + created_at.microsecond
+    payload = json.dumps([micros, doc_id], separators=(",", ":")).encode()
+    encoded = base64.urlsafe_b64encode(payload).decode().rstrip("=")
+    return f"{encoded}.{_signature(payload)}"
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, str]:
+    """Decode a cursor into (created_at, doc_id), see encode_cursor()"""
+    try:
+        encoded, signature = cursor.split(".")
+        payload = base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4))
+        if not hmac.compare_digest(signature, _signature(payload)):
+            raise InvalidCursorError("Cursor signature doesn't match")
+        micros, doc_id = json.loads(payload)
+        seconds, micros = divmod(int(micros), 1_000_000)
+        created_at = datetime.fromtimestamp(seconds, timezone.utc).replace(
+            microsecond=micros
+        )
+        return created_at, str(doc_id)
+    except InvalidCursorError:
+        raise
+    except (ValueError, TypeError) as e:
+        raise InvalidCursorError("Malformed cursor") from e
@@ -0,0 +1,83 @@
+"""Stored image contents that are sent to clients in fixed-size chunks."""
+
+import asyncio
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+CHUNK_SIZE = 64 * 1024
+
+
+class ImageBody(ABC):
+    """
+    Contents of a stored image with a known length. chunks() yields the bytes
+    from start to end (inclusive), never holding more than one chunk per
+    request on top of what is already cached.
+    """
+
+    def __init__(self, length: int, chunk_size: int = CHUNK_SIZE):
+        self.length = length
+        self.chunk_size = chunk_size
+
+    @abstractmethod
+    def chunks(self, start: int = 0, end: Optional[int] = None) -> AsyncIterator:
+        """Yield the bytes from start to end, end defaults to the last byte"""
+
+
+class MemoryImageBody(ImageBody):
+    """An image held in the in-memory cache"""
+
+    def __init__(self, data: bytes, chunk_size: int = CHUNK_SIZE):
+        super().__init__(len(data), chunk_size)
+        self.data = data
+
+    async def chunks(self, start: int = 0, end: Optional[int] = None):
+        end = self.length - 1 if end is None else end
+        for offset in range(start, end + 1, self.chunk_size):
+            yield self.data[offset : min(offset + self.chunk_size, end + 1)]
+
+
+class FileImageBody(ImageBody):
+    """An image in the on-disk cache, read in a worker thread"""
+
+    def __init__(self, path: Path, chunk_size: int = CHUNK_SIZE):
+        super().__init__(path.stat().st_size, chunk_size)
+        self.path = path
+
+    async def chunks(self, start: int = 0, end: Optional[int] = None):
+        end = self.length - 1 if end is None else end
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = await asyncio.to_thread(f.read, min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+
+class BlobImageBody(ImageBody):
+    """An image read from Cloud Storage chunk by chunk"""
+
+    def __init__(self, blob, length: int, run_storage_call, chunk_size=CHUNK_SIZE):
+        super().__init__(length, chunk_size)
+        self.blob = blob
+        self.run_storage_call = run_storage_call
+
+    async def chunks(self, start: int = 0, end: Optional[int] = None):
+        end = self.length - 1 if end is None else end
+        reader = self.blob.open("rb", chunk_size=self.chunk_size)
+        try:
+            await self.run_storage_call(reader.seek, start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = await self.run_storage_call(
+                    reader.read, min(self.chunk_size, remaining)
+                )
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            reader.close()
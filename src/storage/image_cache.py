@@ -0,0 +1,201 @@
+"""Byte-budgeted cache for stored images."""
+
+import asyncio
+import hashlib
+import os
+import tempfile
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional, Union
+
+
+class ImageCache:
+    """
+    In-memory LRU cache for image bytes, bounded by total size, with an
+    optional on-disk tier.
+
+    Concurrent misses for the same key share a single fetch. Entries larger
+    than max_entry_bytes are passed through without being cached in memory.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        max_entry_bytes: Optional[int] = None,
+        disk_dir: Optional[str] = None,
+        max_disk_bytes: int = 0,
+    ):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes or max_bytes // 8
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.max_disk_bytes = max_disk_bytes
+
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_bytes = 0
+        self._pending: Dict[str, asyncio.Future] = {}
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.bytes_from_cache = 0
+        self.bytes_fetched = 0
+
+        self._disk_bytes = 0
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            self._disk_bytes = sum(
+                path.stat().st_size for path in self.disk_dir.iterdir()
+            )
+
+    async def get_or_fetch(
+        self, key: str, fetch: Callable[[], Awaitable[bytes]]
+    ) -> bytes:
+        """Return the cached bytes for key, calling fetch() on a miss"""
+        data = self.get_memory(key)
+        if data is not None:
+            self.hits += 1
+            self.bytes_from_cache += len(data)
+            return data
+
+        # Share the fetch with other requests for the same key. The fetch runs
+        # in its own task so a disconnecting client doesn't cancel it for all.
+        pending = self._pending.get(key)
+        if pending:
+            self.coalesced += 1
+        else:
+            pending = asyncio.create_task(self._load(key, fetch))
+            self._pending[key] = pending
+            pending.add_done_callback(lambda task: self._load_done(key, task))
+        return await asyncio.shield(pending)
+
+    async def open(
+        self, key: str, fetch: Callable[[], Awaitable[bytes]]
+    ) -> Union[bytes, Path]:
+        """
+        Like get_or_fetch(), but entries in the disk tier that are too large
+        for memory are returned as a path so they can be streamed from disk.
+        """
+        if self.get_memory(key) is None:
+            path = self.disk_path(key)
+            try:
+                if path and path.stat().st_size > self.max_entry_bytes:
+                    self.disk_hits += 1
+                    return path
+            except FileNotFoundError:
+                pass
+        return await self.get_or_fetch(key, fetch)
+
+    async def _load(self, key: str, fetch: Callable[[], Awaitable[bytes]]) -> bytes:
+        data = await self._read_disk(key)
+        if data is not None:
+            self.disk_hits += 1
+            self.bytes_from_cache += len(data)
+        else:
+            self.misses += 1
+            data = await fetch()
+            self.bytes_fetched += len(data)
+            await self._write_disk(key, data)
+
+        self._put_memory(key, data)
+        return data
+
+    def _load_done(self, key: str, task: asyncio.Task):
+        del self._pending[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved, waiters re-raise it themselves
+            task.exception()
+
+    def get_memory(self, key: str) -> Optional[bytes]:
+        """Return bytes from the memory tier without counting a lookup"""
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+        return data
+
+    def _put_memory(self, key: str, data: bytes):
+        if len(data) > self.max_entry_bytes:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous)
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    @property
+    def enabled(self) -> bool:
+        """False if nothing would ever be cached"""
+        return self.max_bytes > 0 or self.disk_dir is not None
+
+    def disk_path(self, key: str) -> Optional[Path]:
+        """Location of a key in the disk tier, None if there is no disk tier"""
+        if not self.disk_dir:
+            return None
+        return self.disk_dir / hashlib.sha256(key.encode()).hexdigest()
+
+    async def _read_disk(self, key: str) -> Optional[bytes]:
+        path = self.disk_path(key)
+        if not path:
+            return None
+        try:
+            return await asyncio.to_thread(self._read_file, path)
+        except FileNotFoundError:
+            return None
+
+    def _read_file(self, path: Path) -> bytes:
+        data = path.read_bytes()
+        # Mark the file as recently used for eviction, atime is often disabled
+        os.utime(path)
+        return data
+
+    async def _write_disk(self, key: str, data: bytes):
+        path = self.disk_path(key)
+        if not path or len(data) > self.max_disk_bytes:
+            return
+        await asyncio.to_thread(self._write_file, path, data)
+        self._disk_bytes += len(data)
+        if self._disk_bytes > self.max_disk_bytes:
+            await asyncio.to_thread(self._evict_disk)
+
+    def _write_file(self, path: Path, data: bytes):
+        # Write to a temporary file first so readers never see partial images
+        fd, temp_path = tempfile.mkstemp(dir=self.disk_dir, prefix=".tmp-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    def _evict_disk(self):
+        """Remove the least recently used files until the disk tier fits again"""
+        files = sorted(
+            (entry.stat().st_mtime, entry.stat().st_size, entry)
+            for entry in self.disk_dir.iterdir()
+            if not entry.name.startswith(".tmp-")
+        )
+        total = sum(size for _, size, _ in files)
+        target = self.max_disk_bytes * 0.9
+        for _, size, entry in files:
+            if total <= target:
+                break
+            entry.unlink(missing_ok=True)
+            total -= size
+        self._disk_bytes = total
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit ratio and byte counters"""
+        hits = self.hits + self.disk_hits + self.coalesced
+        lookups = hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "memory_bytes": self._memory_bytes,
+            "memory_entries": len(self._memory),
+            "disk_bytes": self._disk_bytes,
+            "bytes_from_cache": self.bytes_from_cache,
+            "bytes_fetched": self.bytes_fetched,
+        }
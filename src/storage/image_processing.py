@@ -0,0 +1,216 @@
+"""Image decoding and resizing for uploaded images."""
+
+import asyncio
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterable, Optional, Union
+from PIL import ExifTags, Image, ImageOps, UnidentifiedImageError
+from pillow_heif import register_heif_opener
+
+register_heif_opener()
+Image.init()
+
+# Bounding boxes of the stored image sizes
+IMAGE_SIZES = {
+    "thumb": (320, 240),
+    "medium": (640, 480),
+    "full": (1024, 768),
+}
+
+# Stored image formats with their content type and encoder options
+IMAGE_FORMATS = {
+    "jpeg": ("image/jpeg", {"format": "JPEG", "quality": 85}),
+    "webp": ("image/webp", {"format": "WEBP", "quality": 80, "method": 4}),
+}
+if "AVIF" in Image.SAVE:
+    IMAGE_FORMATS["avif"] = ("image/avif", {"format": "AVIF", "quality": 60})
+
+# EXIF orientations that rotate the image by 90 or 270 degrees
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+class ImageProcessingError(ValueError):
+    """Raised when an uploaded image can't be processed"""
+
+
+class ImageTooLargeError(ImageProcessingError):
+    """Raised when an image has more pixels than allowed"""
+
+
+class ImageWorkersBusyError(ImageProcessingError):
+    """Raised when the image worker pool has no room for another job"""
+
+
+class ImageProcessingTimeoutError(ImageProcessingError):
+    """Raised when processing an image takes too long"""
+
+
+def _fit_size(size: tuple[int, int], max_width: int, max_height: int):
+    """Largest size within the bounding box that keeps the aspect ratio"""
+    width, height = size
+    ratio = min(max_width / width, max_height / height, 1)
+    return (max(1, int(width * ratio)), max(1, int(height * ratio)))
+
+
+def _decode_image(
+    image_data: Union[bytes, str],
+    max_width: int,
+    max_height: int,
+    max_pixels: Optional[int] = None,
+) -> Image.Image:
+    """
+    Decode an image, apply EXIF orientation and resize it to fit within max
+    dimensions. Accepts image bytes or the path of an image file. Returns an
+    upright RGB image.
+    """
+    source = image_data if isinstance(image_data, str) else io.BytesIO(image_data)
+    try:
+        image = Image.open(source)
+    except UnidentifiedImageError:
+        raise ImageProcessingError("Unsupported or corrupt image")
+
+    if max_pixels and image.width * image.height > max_pixels:
+        raise ImageTooLargeError(
+            f"Image is {image.width}x{image.height}, "
+            f"at most {max_pixels} pixels are allowed"
+        )
+
+    # Work out the target size in upright orientation
+    orientation = image.getexif().get(ExifTags.Base.Orientation, 1)
+    transposed = orientation in TRANSPOSED_ORIENTATIONS
+    upright_size = (image.height, image.width) if transposed else image.size
+    target_size = _fit_size(upright_size, max_width, max_height)
+
+    # Let the JPEG decoder downscale while decoding, the result is never
+    # smaller than the requested size so the final resize still applies
+    if image.format == "JPEG" and target_size != upright_size:
+        stored_size = (target_size[1], target_size[0]) if transposed else target_size
+        image.draft("RGB", stored_size)
+
+    # Apply EXIF orientation (all 8 values), this decodes the image
+    try:
+        image = ImageOps.exif_transpose(image)
+    except OSError:
+        raise ImageProcessingError("Unsupported or corrupt image")
+
+    # Convert to RGB if needed
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+
+    return _resize(image, target_size)
+
+
+def _resize(image: Image.Image, size: tuple[int, int]) -> Image.Image:
+    if image.size == size:
+        return image
+    # reducing_gap uses a fast integer reduce() before the LANCZOS pass
+    return image.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+
+def _encode(image: Image.Image, image_format: str) -> bytes:
+    _, options = IMAGE_FORMATS[image_format]
+    output = io.BytesIO()
+    image.save(output, **options)
+    return output.getvalue()
+
+
+def create_derivatives(
+    image_data: Union[bytes, str],
+    sizes: Dict[str, tuple[int, int]],
+    formats: Iterable[str],
+    max_pixels: Optional[int] = None,
+) -> Dict[tuple[str, str], bytes]:
+    """
+    Create every combination of size and format of an image, given as bytes
+    or as the path of an image file.
+
+    The image is decoded once at the largest size, smaller sizes are scaled
+    down from there. Returns encoded images keyed by (size, format).
+    """
+    largest = max(sizes.values(), key=lambda box: box[0] * box[1])
+    image = _decode_image(image_data, *largest, max_pixels)
+
+    derivatives = {}
+    for size_name, (max_width, max_height) in sizes.items():
+        sized = _resize(image, _fit_size(image.size, max_width, max_height))
+        for image_format in formats:
+            derivatives[(size_name, image_format)] = _encode(sized, image_format)
+    return derivatives
+
+
+class ImageWorkerPool:
+    """
+    Runs image processing in a pool of worker processes, so decoding and
+    resizing don't block the event loop or hold the GIL.
+
+    At most max_workers jobs run at the same time and at most max_pending jobs
+    wait for a worker, further jobs are rejected right away. A job that times
+    out keeps its worker busy until it completes, it is counted until then.
+    If a worker dies, for example killed for running out of memory, the pool
+    is replaced and the jobs it was running fail as busy.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 2,
+        max_pending: int = 16,
+        timeout: float = 30,
+        max_pixels: Optional[int] = None,
+    ):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.max_pixels = max_pixels
+        self._in_flight = 0
+        self._executor = self._new_executor()
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        # Don't fork, the parent process runs gRPC and HTTP client threads
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+
+    def _job_done(self, _):
+        self._in_flight -= 1
+
+    def _replace_broken(self, executor: ProcessPoolExecutor):
+        # Jobs failing together share the broken pool, replace it only once
+        if self._executor is executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = self._new_executor()
+
+    async def _run(self, func, *args):
+        if self._in_flight >= self.max_workers + self.max_pending:
+            raise ImageWorkersBusyError("Too many images are being processed")
+
+        loop = asyncio.get_running_loop()
+        executor = self._executor
+        try:
+            future = loop.run_in_executor(executor, func, *args)
+            self._in_flight += 1
+            future.add_done_callback(self._job_done)
+            # Shield the job so a timeout doesn't drop the in-flight count early
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            raise ImageProcessingTimeoutError("Processing the image took too long")
+        except BrokenProcessPool:
+            self._replace_broken(executor)
+            raise ImageWorkersBusyError("An image worker stopped unexpectedly")
+
+    async def create_derivatives(
+        self,
+        image_data: Union[bytes, str],
+        sizes: Dict[str, tuple[int, int]],
+        formats: Iterable[str],
+    ) -> Dict[tuple[str, str], bytes]:
+        """Create image derivatives in a worker process, see create_derivatives()"""
+        return await self._run(
+            create_derivatives, image_data, sizes, list(formats), self.max_pixels
+        )
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
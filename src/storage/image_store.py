@@ -1,141 +1,259 @@
 from google.cloud import storage
 from google.cloud import firestore
+from google.api_core.exceptions import AlreadyExists
 from src.core.settings import settings
 from datetime import datetime, timezone
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Union
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import asyncio
+import functools
 import hashlib
-from PIL import Image
-import io
-from pillow_heif import register_heif_opener
+import sys
+from src.storage.image_body import (
+    BlobImageBody,
+    FileImageBody,
+    ImageBody,
+    MemoryImageBody,
+)
+from src.storage.image_cache import ImageCache
+from src.storage.image_processing import (
+    IMAGE_FORMATS,
+    IMAGE_SIZES,
+    ImageWorkerPool,
+)
 
-register_heif_opener()
+
+@dataclass
+class PreparedImage:
+    """An uploaded image that is processed, but possibly not stored yet"""
+
+    image_id: str
+    image_data: bytes
+    content_type: str
+    file_hash: str
+    # None when the image was stored before
+    derivatives: Optional[Dict[tuple[str, str], bytes]] = None
 
 
 class ImageStore:
-    def __init__(self, storage_client: storage.Client):
+    def __init__(self, storage_client: storage.Client, db: firestore.AsyncClient):
         self.storage_client = storage_client
         self.bucket = self.storage_client.bucket(settings.BUCKET_NAME)
-        self.db = firestore.Client()
+        self.db = db
         self.images = self.db.collection("images")
-        self.MAX_WIDTH = 1024
-        self.MAX_HEIGHT = 768
+        # The Cloud Storage client is synchronous, run its calls on a bounded pool
+        self._storage_executor = ThreadPoolExecutor(
+            max_workers=settings.STORAGE_MAX_WORKERS,
+            thread_name_prefix="image-store",
+        )
+        # Decoding and resizing are CPU heavy, run them in worker processes
+        self.image_workers = ImageWorkerPool(
+            max_workers=settings.IMAGE_WORKERS,
+            max_pending=settings.IMAGE_QUEUE_SIZE,
+            timeout=settings.IMAGE_TIMEOUT,
+            max_pixels=settings.IMAGE_MAX_PIXELS,
+        )
+        # Hot images are served from memory (and optionally local disk)
+        self.image_cache = ImageCache(
+            max_bytes=settings.IMAGE_CACHE_BYTES,
+            disk_dir=settings.IMAGE_CACHE_DIR,
+            max_disk_bytes=settings.IMAGE_CACHE_DISK_BYTES,
+        )
+
+    async def _run_storage_call(self, func, *args, **kwargs):
+        """Run a blocking Cloud Storage call without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._storage_executor, functools.partial(func, *args, **kwargs)
+        )
 
     async def find_image_by_hash(self, file_hash: str) -> Optional[Dict[str, Any]]:
-        """Look up an image by its hash"""
-        query = self.images.where(
-            field_path="hash", op_string="==", value=file_hash
-        ).limit(1)
-        docs = query.stream()
-        for doc in docs:
-            return {"id": doc.id, **doc.to_dict()}
-        return None
-
-    async def store_image_metadata(self, content_type: str, file_hash: str) -> str:
-        """Store image metadata in Firestore and return its ID"""
-        # Check for existing image
-        existing = await self.find_image_by_hash(file_hash)
-        if existing:
-            return existing["id"]
+        """
+        Look up an image by its hash. Images are stored under their hash,
+        images stored before that have an alias document that holds their ID.
+        """
+        doc = await self.images.document(file_hash).get()
+        if not doc.exists:
+            return None
+        image = doc.to_dict()
+        if "image_id" in image:
+            return {"id": image["image_id"], "hash": file_hash}
+        return {"id": doc.id, **image}
 
-        # Store new image metadata
-        doc_ref = self.images.document()
-        doc_ref.set(
-            {
-                "content_type": content_type,
-                "hash": file_hash,
-                "created_at": datetime.now(timezone.utc),
-            }
-        )
+    async def store_image_metadata(
+        self, content_type: str, file_hash: str, derivatives: list[str] = None
+    ) -> str:
+        """
+        Store image metadata in Firestore and return its ID, the content hash.
+        If the same image was stored concurrently, the existing ID is returned.
+        """
+        doc_ref = self.images.document(file_hash)
+        try:
+            # Create fails if the document exists, so uploads never race
+            await doc_ref.create(
+                {
+                    "content_type": content_type,
+                    "hash": file_hash,
+                    "created_at": datetime.now(timezone.utc),
+                    "derivatives": derivatives or [],
+                }
+            )
+        except AlreadyExists:
+            existing = await self.find_image_by_hash(file_hash)
+            return existing["id"]
         return doc_ref.id
 
-    async def process_and_store_image(
-        self, contents: bytes, content_type: str
-    ) -> tuple[str, bytes]:
+    async def prepare_image(
+        self,
+        contents: Union[bytes, str],
+        content_type: str,
+        file_hash: Optional[str] = None,
+    ) -> PreparedImage:
         """
-        Process an image by checking for duplicates and storing if new.
-        Returns tuple of (image_id, resized_image_data).
+        Check for duplicates and create the derivatives of a new image, without
+        storing anything. New images are identified by their content hash, so
+        the image can be referenced before store_prepared_image() completes.
+
+        contents is the image data or the path of an image file, in which case
+        the hash of the file has to be passed as well.
         """
         # Compute hash of original image
-        file_hash = self.compute_hash(contents)
+        file_hash = file_hash or self.compute_hash(contents)
 
         # Check for existing image
         existing_image = await self.find_image_by_hash(file_hash)
 
         if existing_image:
             # For existing images, download the resized version
-            blob = self.get_image_blob(existing_image["id"])
-            return existing_image["id"], blob.download_as_bytes()
+            image_bytes = await self.download_image(existing_image["id"])
+            return PreparedImage(
+                existing_image["id"], image_bytes, content_type, file_hash
+            )
 
-        # For new images, resize once
-        resized_image = self.resize_image(contents)
+        # For new images, decode once and create every size and format
+        derivatives = await self.image_workers.create_derivatives(
+            contents, IMAGE_SIZES, IMAGE_FORMATS
+        )
+        return PreparedImage(
+            file_hash,
+            derivatives[("full", "jpeg")],
+            content_type,
+            file_hash,
+            derivatives,
+        )
 
-        # Store new image metadata first to get an ID
-        image_id = await self.store_image_metadata(content_type, file_hash)
+    async def store_prepared_image(self, image: PreparedImage):
+        """Store a new image, see prepare_image()"""
+        if image.derivatives is None:
+            return
 
-        # Store the resized image
-        await self.store_image(resized_image, content_type, image_id)
+        # Store the resized images before the metadata that points to them
+        await self.store_derivatives(image.image_id, image.derivatives)
+        await self.store_image_metadata(
+            image.content_type,
+            image.file_hash,
+            derivatives=[derivative_name(*key) for key in image.derivatives],
+        )
 
-        return image_id, resized_image
+    def store_prepared_image_in_background(self, image: PreparedImage) -> asyncio.Task:
+        """
+        Store a new image in a task, see store_prepared_image(). Failures are
+        logged when the task completes, whether or not anyone awaits it.
+        """
+        task = asyncio.create_task(self.store_prepared_image(image))
+        task.add_done_callback(functools.partial(_log_store_failure, image.image_id))
+        return task
 
-    def get_image_blob(self, image_id: str):
-        """Get a blob reference for an image"""
-        return self.bucket.blob(f"images/{image_id}")
+    async def process_and_store_image(
+        self, contents: bytes, content_type: str
+    ) -> tuple[str, bytes]:
+        """
+        Process an image by checking for duplicates and storing if new.
+        Returns tuple of (image_id, resized_image_data).
+        """
+        image = await self.prepare_image(contents, content_type)
+        await self.store_prepared_image(image)
+        return image.image_id, image.image_data
 
-    def resize_image(self, image_data: bytes) -> bytes:
-        """Resize image, preserving aspect ratio, to max dimensions and convert to JPEG"""
-        image = Image.open(io.BytesIO(image_data))
+    def get_image_blob(self, image_id: str, size: str = "full", image_format="jpeg"):
+        """Get a blob reference for an image in the given size and format"""
+        if size == "full" and image_format == "jpeg":
+            return self.bucket.blob(f"images/{image_id}")
+        return self.bucket.blob(
+            f"images/{image_id}/{derivative_name(size, image_format)}"
+        )
 
-        # Apply EXIF rotation if present
-        try:
-            exif = image.getexif()
-            if exif is not None:
-                orientation = exif.get(274)  # 274 is the orientation tag
-                if orientation is not None:
-                    # Rotation values
-                    if orientation == 3:
-                        image = image.rotate(180, expand=True)
-                    elif orientation == 6:
-                        image = image.rotate(270, expand=True)
-                    elif orientation == 8:
-                        image = image.rotate(90, expand=True)
-        except (AttributeError, KeyError, IndexError):
-            # Handle images without EXIF data
-            pass
-
-        # Convert to RGB if needed
-        if image.mode in ("RGBA", "P", "CMYK"):
-            image = image.convert("RGB")
-
-        # Only convert to JPEG if it's not already JPEG
-        if image.format != "JPEG":
-            jpeg_buffer = io.BytesIO()
-            image.save(jpeg_buffer, format="JPEG", quality=85)
-            image = Image.open(jpeg_buffer)
-
-        # Calculate aspect ratio
-        width_ratio = self.MAX_WIDTH / image.width
-        height_ratio = self.MAX_HEIGHT / image.height
-        ratio = min(width_ratio, height_ratio)
-
-        # Only resize if image is larger than max dimensions
-        if ratio < 1:
-            new_width = int(image.width * ratio)
-            new_height = int(image.height * ratio)
-            image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-
-        # Convert to JPEG bytes
-        output = io.BytesIO()
-        image.save(output, format="JPEG", quality=85)
-        return output.getvalue()
+    async def download_image(
+        self, image_id: str, size: str = "full", image_format: str = "jpeg"
+    ) -> bytes:
+        """
+        Download a stored image, by default the full size JPEG.
+        Raises google.cloud.exceptions.NotFound if it doesn't exist.
+        """
+        blob = self.get_image_blob(image_id, size, image_format)
+        return await self.image_cache.get_or_fetch(
+            blob.name, lambda: self._run_storage_call(blob.download_as_bytes)
+        )
+
+    async def open_image(
+        self, image_id: str, size: str = "full", image_format: str = "jpeg"
+    ) -> ImageBody:
+        """
+        Open a stored image for streaming to a client. Cached images are read
+        from memory or the disk cache, uncached images are read from Cloud
+        Storage in chunks when the cache is disabled.
+        Raises google.cloud.exceptions.NotFound if it doesn't exist.
+        """
+        chunk_size = settings.IMAGE_STREAM_CHUNK_BYTES
+        blob = self.get_image_blob(image_id, size, image_format)
+
+        if not self.image_cache.enabled:
+            await self._run_storage_call(blob.reload)
+            return BlobImageBody(blob, blob.size, self._run_storage_call, chunk_size)
+
+        cached = await self.image_cache.open(
+            blob.name, lambda: self._run_storage_call(blob.download_as_bytes)
+        )
+        if isinstance(cached, bytes):
+            return MemoryImageBody(cached, chunk_size)
+        return FileImageBody(cached, chunk_size)
 
     def compute_hash(self, image_data: bytes) -> str:
         """Compute SHA256 hash of image data"""
         return hashlib.sha256(image_data).hexdigest()
 
-    async def store_image(
-        self, image_data: bytes, content_type: str, image_id: str
-    ) -> str:
-        """Store a resized JPEG image in Cloud Storage"""
-        resized_image = self.resize_image(image_data)
-        blob = self.get_image_blob(image_id)
-        blob.upload_from_string(resized_image, content_type="image/jpeg")
+    async def store_derivatives(
+        self, image_id: str, derivatives: Dict[tuple[str, str], bytes]
+    ):
+        """Store resized images keyed by (size, format) in Cloud Storage"""
+        uploads = []
+        for (size, image_format), image_data in derivatives.items():
+            blob = self.get_image_blob(image_id, size, image_format)
+            content_type, _ = IMAGE_FORMATS[image_format]
+            uploads.append(
+                self._run_storage_call(
+                    blob.upload_from_string, image_data, content_type=content_type
+                )
+            )
+        await asyncio.gather(*uploads)
+
+    def shutdown(self):
+        """Stop the image worker processes and the storage threads"""
+        self.image_workers.shutdown()
+        self._storage_executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _log_store_failure(image_id: str, task: asyncio.Task):
+    if not task.cancelled() and task.exception():
+        # Derivatives that were uploaded stay behind without metadata
+        print(
+            f"Storing image {image_id} failed, its uploads may be orphaned: "
+            f"{str(task.exception())}",
+            file=sys.stderr,
+        )
+
+
+def derivative_name(size: str, image_format: str) -> str:
+    """Name of a stored derivative, for example 'thumb.webp'"""
+    return f"{size}.{image_format}"
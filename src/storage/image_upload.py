@@ -0,0 +1,105 @@
+"""Streaming ingestion of uploaded images."""
+
+import asyncio
+import hashlib
+from dataclasses import dataclass
+from typing import BinaryIO, Optional
+from fastapi import UploadFile
+from PIL import Image
+from src.storage.image_processing import ImageProcessingError, ImageTooLargeError
+
+CHUNK_SIZE = 256 * 1024
+
+# Brands in the ftyp box of HEIC and HEIF files
+HEIF_BRANDS = {
+    b"heic": "image/heic",
+    b"heix": "image/heic",
+    b"hevc": "image/heic",
+    b"hevx": "image/heic",
+    b"heim": "image/heic",
+    b"heis": "image/heic",
+    b"mif1": "image/heif",
+    b"msf1": "image/heif",
+}
+
+
+class UploadTooLargeError(ImageTooLargeError):
+    """Raised when an upload has more bytes than allowed"""
+
+
+def sniff_content_type(header: bytes) -> Optional[str]:
+    """Detect the image type from the first bytes of a file"""
+    if header.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if header.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    if header[4:8] == b"ftyp":
+        return HEIF_BRANDS.get(header[8:12])
+    return None
+
+
+@dataclass
+class UploadedImage:
+    """An uploaded image that passed the checks of ingest_upload()"""
+
+    data: bytes
+    content_type: str
+    file_hash: str
+
+
+def _check_dimensions(file: BinaryIO, max_pixels: int):
+    """Read the image header, without decoding, and check the pixel count"""
+    file.seek(0)
+    try:
+        with Image.open(file) as image:
+            width, height = image.size
+    except Image.DecompressionBombError:
+        raise ImageTooLargeError("Image has too many pixels")
+    except Exception:
+        raise ImageProcessingError("Unsupported or corrupt image")
+
+    if width * height > max_pixels:
+        raise ImageTooLargeError(
+            f"Image is {width}x{height}, at most {max_pixels} pixels are allowed"
+        )
+
+
+async def ingest_upload(
+    file: UploadFile,
+    max_bytes: int,
+    max_pixels: int,
+    chunk_size: int = CHUNK_SIZE,
+) -> UploadedImage:
+    """
+    Check an upload in place, in the file Starlette spooled it to. It is read
+    in chunks, hashing it and enforcing max_bytes on the way. Files that
+    aren't images are rejected by their first bytes and images with more
+    than max_pixels pixels by their header. The image is only read into
+    memory once it passed these checks.
+    """
+    file_hash = hashlib.sha256()
+    content_type = None
+    size = 0
+    await file.seek(0)
+    while chunk := await file.read(chunk_size):
+        if size == 0:
+            content_type = sniff_content_type(chunk[:16])
+            if not content_type:
+                raise ImageProcessingError(
+                    "Only JPEG, PNG, GIF and HEIC/HEIF images are allowed"
+                )
+        size += len(chunk)
+        if size > max_bytes:
+            raise UploadTooLargeError(
+                f"Image is larger than {max_bytes / (1024 * 1024):g} MB"
+            )
+        file_hash.update(chunk)
+
+    if size == 0:
+        raise ImageProcessingError("The uploaded file is empty")
+    await asyncio.to_thread(_check_dimensions, file.file, max_pixels)
+
+    await file.seek(0)
+    return UploadedImage(await file.read(), content_type, file_hash.hexdigest())
@@ -1,32 +1,59 @@
 from google.cloud import firestore
+from google.cloud.firestore_v1.field_path import FieldPath
 from datetime import datetime, timezone
-from typing import Dict, Any
+from typing import Dict, Any, Iterable, Optional
+from src.storage.cursors import decode_cursor, encode_cursor
+
+# User fields copied onto each screenplay, enough to credit the author
+AUTHOR_FIELDS = ("name", "picture")
+
+# Fields shown in screenplay listings, nested fields are selected by path
+SUMMARY_FIELDS = (
+    "image_id",
+    "genre",
+    "public",
+    "created_at",
+    "structured_scene.scene_heading",
+)
+
+
+def author_snapshot(user: Dict[str, Any]) -> Dict[str, Any]:
+    """Compact copy of a user to store with their screenplays"""
+    return {field: user.get(field) for field in AUTHOR_FIELDS}
 
 
 class ScreenplayStore:
-    def __init__(self, db: firestore.Client):
+    def __init__(self, db: firestore.AsyncClient):
         self.db = db
         self.screenplays = self.db.collection("screenplays")
 
     async def store_screenplay(
-        self, screenplay_data: Dict[str, Any], image_id: str
+        self,
+        screenplay_data: Dict[str, Any],
+        image_id: str,
+        author: Optional[Dict[str, Any]] = None,
     ) -> str:
-        """Store a screenplay in Firestore and return its ID"""
+        """
+        Store a screenplay in Firestore and return its ID. A snapshot of the
+        author is stored with it, so viewing it takes a single read.
+        """
         doc_ref = self.screenplays.document()
 
         # Add metadata
         screenplay_data["created_at"] = datetime.now(timezone.utc)
         screenplay_data["image_id"] = image_id
+        if author:
+            screenplay_data["author"] = author_snapshot(author)
 
         # Store the document
-        doc_ref.set(screenplay_data)
+        await doc_ref.set(screenplay_data)
 
         return doc_ref.id
 
     async def get_screenplay(self, screenplay_id: str) -> Dict[str, Any] | None:
         """Retrieve a screenplay from Firestore by ID"""
         doc_ref = self.screenplays.document(screenplay_id)
-        doc = doc_ref.get()
+        doc = await doc_ref.get()
         if doc.exists:
             return doc.to_dict()
         return None
@@ -39,7 +66,7 @@ class ScreenplayStore:
         Returns True if successful, False if not found or not authorized
         """
         doc_ref = self.screenplays.document(screenplay_id)
-        doc = doc_ref.get()
+        doc = await doc_ref.get()
 
         if not doc.exists:
             return False
@@ -52,7 +79,7 @@ class ScreenplayStore:
         allowed_settings = {k: v for k, v in settings.items() if k in ["public"]}
 
         if allowed_settings:
-            doc_ref.update(allowed_settings)
+            await doc_ref.update(allowed_settings)
             return True
 
         return False
@@ -60,24 +87,29 @@ class ScreenplayStore:
     async def get_paginated_screenplays(
         self,
         page_size: int = 12,
-        page_starts_at: str = None,
+        cursor: str = None,
         public_only: bool = True,
         user_id: str = None,
+        fields: Optional[Iterable[str]] = SUMMARY_FIELDS,
     ) -> tuple[list[Dict[str, Any]], str | None]:
         """
-        Retrieve paginated screenplays, ordered by creation date
-        Returns tuple of (screenplays list, next_page_start_id)
+        Retrieve paginated screenplays, newest first, with ties broken by
+        document ID so pages are stable when creation times collide.
+        Returns tuple of (screenplays list, next page cursor)
 
         Args:
             page_size: Number of items per page
-            page_starts_at: ID of document to start at for pagination
+            cursor: Cursor from a previous page, raises InvalidCursorError
+                if it wasn't issued by this app
             public_only: If True, only return public screenplays
             user_id: If provided, only return screenplays for this user
+            fields: Fields to return, the listing summary by default. Pass
+                None to return whole documents.
         """
         # Start with base query
         query = self.screenplays.order_by(
             "created_at", direction=firestore.Query.DESCENDING
-        )
+        ).order_by(FieldPath.document_id(), direction=firestore.Query.DESCENDING)
 
         # Add filters
         if public_only:
@@ -85,18 +117,24 @@ class ScreenplayStore:
         if user_id:
             query = query.where("user_id", "==", user_id)
 
-        # Add pagination limit
-        query = query.limit(page_size + 1)
+        # Only transfer the fields that are shown, plus the cursor field
+        if fields is not None:
+            query = query.select(list(dict.fromkeys([*fields, "created_at"])))
 
-        if page_starts_at:
-            start_doc = self.screenplays.document(page_starts_at).get()
-            if start_doc.exists:
-                query = query.start_at(start_doc)
+        # Add pagination limit, the extra item tells if there's a next page
+        query = query.limit(page_size + 1)
 
-        docs = list(query.stream())
+        # The cursor holds the position itself, so no document read is needed
+        if cursor:
+            created_at, doc_id = decode_cursor(cursor)
+            query = query.start_after(
+                {
+                    "created_at": created_at,
+                    FieldPath.document_id(): self.screenplays.document(doc_id),
+                }
+            )
 
-        # If we got an extra item, use it as the next page start
-        next_page_start = docs[page_size].id if len(docs) > page_size else None
+        docs = [doc async for doc in query.stream()]
 
         # Convert visible items to list of dicts
         result = []
@@ -105,4 +143,10 @@ class ScreenplayStore:
             screenplay["id"] = doc.id
             result.append(screenplay)
 
-        return result, next_page_start
+        # Continue after the last visible item
+        next_cursor = None
+        if len(docs) > page_size:
+            last = result[-1]
+            next_cursor = encode_cursor(last["created_at"], last["id"])
+
+        return result, next_cursor
@@ -1,40 +1,59 @@
+import asyncio
 from google.cloud import firestore
 from datetime import datetime, timezone
 from typing import Dict, Any, Optional
-from google.oauth2 import id_token
-from google.auth.transport import requests
+from src.auth.google_certs import GoogleTokenVerifier
+from src.core.cache import TTLCache
 from src.core.settings import settings
 
 
 class UserStore:
-    def __init__(self, db: firestore.Client):
+    def __init__(
+        self,
+        db: firestore.AsyncClient,
+        cache: Optional[TTLCache] = None,
+        token_verifier: Optional[GoogleTokenVerifier] = None,
+    ):
         self.db = db
         self.users = self.db.collection("users")
+        # Users by ID, entries are invalidated when this process writes a user
+        self.cache = cache
+        self.token_verifier = token_verifier or GoogleTokenVerifier(
+            settings.GOOGLE_CLIENT_ID
+        )
 
     async def find_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
         """Look up a user by email"""
         query = self.users.where(field_path="email", op_string="==", value=email).limit(
             1
         )
-        docs = list(query.stream())
+        docs = [doc async for doc in query.stream()]
         if docs:
             return {"id": docs[0].id, **docs[0].to_dict()}
         return None
 
     async def get_user_by_id(self, user_id: str) -> Optional[Dict[str, Any]]:
         """Look up a user by their ID"""
+        if self.cache:
+            user = self.cache.get(user_id)
+            if user is not None:
+                # Callers get their own copy to modify
+                return dict(user)
+
         doc_ref = self.users.document(user_id)
-        doc = doc_ref.get()
+        doc = await doc_ref.get()
         if doc.exists:
-            return {"id": doc.id, **doc.to_dict()}
+            user = {"id": doc.id, **doc.to_dict()}
+            if self.cache:
+                self.cache.set(user_id, dict(user))
+            return user
         return None
 
     async def validate_token(self, token: str) -> dict:
         """Validate Google OAuth token and return user info"""
         try:
-            return id_token.verify_oauth2_token(
-                token, requests.Request(), settings.GOOGLE_CLIENT_ID
-            )
+            # Verification may fetch certificates and checks an RSA signature
+            return await asyncio.to_thread(self.token_verifier.verify, token)
         except ValueError as e:
             raise ValueError("Invalid token") from e
 
@@ -59,12 +78,14 @@ class UserStore:
             if existing_user:
                 # Update existing user
                 user_ref = self.users.document(existing_user["id"])
-                user_ref.update(user_data)
+                await user_ref.update(user_data)
+                if self.cache:
+                    self.cache.invalidate(existing_user["id"])
                 return existing_user["id"]
             else:
                 # Create new user
                 doc_ref = self.users.document()
-                doc_ref.set(user_data)
+                await doc_ref.set(user_data)
                 return doc_ref.id
 
         except ValueError as e:
@@ -0,0 +1,348 @@
+"""Shared gateway for Gemini model calls."""
+
+import asyncio
+import contextlib
+import random
+import sys
+import threading
+import time
+import requests
+from collections import defaultdict
+from typing import Any, AsyncIterator, Dict, Optional
+from google import genai
+from google.genai import errors
+from src.core.ratelimit import TokenBucket
+
+# HTTP status codes worth retrying: quota, and transient server errors
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+# Counters kept per model, see ModelGateway.stats()
+COUNTERS = (
+    "calls",
+    "successes",
+    "retries",
+    "throttled",
+    "timeouts",
+    "failures",
+    "rejected",
+    "seconds",
+    "rate_limited_seconds",
+)
+
+
+# Marks the end of a stream that is read on a worker thread
+_END_OF_STREAM = object()
+
+
+class ModelUnavailableError(Exception):
+    """Raised when a model can't be called, or didn't answer in time"""
+
+
+class CircuitBreaker:
+    """
+    Stops calls to a model after failure_threshold consecutive failures.
+    After reset_timeout seconds a single trial call is let through, the
+    circuit closes again if it succeeds. A trial call that never reports
+    back is given up on after another reset_timeout seconds.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_started_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        """Whether a call may be made now"""
+        state = self.state
+        if state == "closed":
+            return True
+        now = time.monotonic()
+        if state == "half-open" and (
+            self._trial_started_at is None
+            or now - self._trial_started_at >= self.reset_timeout
+        ):
+            self._trial_started_at = now
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_started_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self._trial_started_at or self.failures >= self.failure_threshold:
+            # Open, or reopen after a failed trial call
+            self.opened_at = time.monotonic()
+        self._trial_started_at = None
+
+
+class ModelGateway:
+    """
+    Makes model calls with a token bucket per model, a bound on concurrent
+    calls, deadlines, retries with exponential backoff and full jitter, and a
+    circuit breaker per model.
+
+    A deadline, in time.monotonic() seconds, covers waiting for the rate
+    limiter, the calls themselves and the backoff between retries.
+    """
+
+    def __init__(
+        self,
+        client: genai.Client,
+        rate_limits: Optional[Dict[str, float]] = None,
+        max_concurrency: int = 8,
+        call_timeout: float = 120,
+        max_retries: int = 4,
+        base_delay: float = 1,
+        max_delay: float = 30,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30,
+    ):
+        """
+        Args:
+            client: Gemini AI client
+            rate_limits: Calls per second by model name, models that aren't
+                listed are not rate limited
+            max_concurrency: Maximum number of calls in flight, for all models
+            call_timeout: Maximum seconds for a single attempt
+            max_retries: Retries after the first attempt of a call
+            base_delay: Backoff before the first retry, it doubles per retry
+            max_delay: Maximum backoff between retries
+            failure_threshold: Consecutive failures that open the circuit
+            reset_timeout: Seconds before an open circuit allows a trial call
+        """
+        self.client = client
+        self.call_timeout = call_timeout
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        # Without bursts, so calls are spread evenly over the quota window
+        self._buckets = {
+            model: TokenBucket(rate, capacity=1)
+            for model, rate in (rate_limits or {}).items()
+            if rate > 0
+        }
+        self._breakers = defaultdict(
+            lambda: CircuitBreaker(failure_threshold, reset_timeout)
+        )
+        self.metrics: Dict[str, Dict[str, float]] = defaultdict(
+            lambda: defaultdict(float)
+        )
+
+    @staticmethod
+    def _is_retryable(error: Exception) -> bool:
+        if isinstance(error, errors.APIError):
+            return error.code in RETRYABLE_STATUS_CODES
+        return isinstance(
+            error,
+            (
+                asyncio.TimeoutError,
+                requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+            ),
+        )
+
+    def _remaining(self, deadline: Optional[float]) -> float:
+        """Seconds an attempt may take, raises if the deadline has passed"""
+        if deadline is None:
+            return self.call_timeout
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise ModelUnavailableError("The deadline for the model call passed")
+        return min(self.call_timeout, remaining)
+
+    def _backoff(self, attempt: int) -> float:
+        """Exponential backoff with full jitter"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    async def _acquire(self, model: str, deadline: Optional[float]):
+        bucket = self._buckets.get(model)
+        if bucket:
+            start = time.monotonic()
+            try:
+                await asyncio.wait_for(bucket.acquire(), self._remaining(deadline))
+            except asyncio.TimeoutError:
+                raise ModelUnavailableError("The deadline for the model call passed")
+            self.metrics[model]["rate_limited_seconds"] += time.monotonic() - start
+
+    async def _retry_delay(
+        self, model: str, error: Exception, attempt: int, deadline: Optional[float]
+    ):
+        """Wait before a retry, or raise if the error is final"""
+        breaker = self._breakers[model]
+        if not self._is_retryable(error):
+            # The model did answer, the request itself was wrong
+            breaker.record_success()
+            raise error
+
+        if isinstance(error, errors.APIError) and error.code == 429:
+            # Throttling means the model is up, it doesn't count as a failure
+            breaker.record_success()
+            self.metrics[model]["throttled"] += 1
+            # Everyone calling this model slows down, not just this caller
+            if model in self._buckets:
+                self._buckets[model].drain()
+        else:
+            breaker.record_failure()
+            if isinstance(error, asyncio.TimeoutError):
+                self.metrics[model]["timeouts"] += 1
+
+        reason = str(error) or type(error).__name__
+        delay = self._backoff(attempt)
+        if attempt >= self.max_retries or (
+            deadline is not None and time.monotonic() + delay >= deadline
+        ):
+            self.metrics[model]["failures"] += 1
+            raise ModelUnavailableError(f"{model} failed: {reason}") from error
+
+        self.metrics[model]["retries"] += 1
+        print(f"Retrying {model} in {delay:.1f}s after: {reason}", file=sys.stderr)
+        await asyncio.sleep(delay)
+
+    def _check_circuit(self, model: str):
+        if not self._breakers[model].allow():
+            self.metrics[model]["rejected"] += 1
+            raise ModelUnavailableError(f"{model} is unavailable, try again later")
+
+    def _record_success(self, model: str, started_at: float):
+        self._breakers[model].record_success()
+        self.metrics[model]["successes"] += 1
+        self.metrics[model]["seconds"] += time.monotonic() - started_at
+
+    async def generate_content(
+        self, model: str, deadline: Optional[float] = None, **kwargs: Any
+    ):
+        """Call generate_content, see the class docstring for the guarantees"""
+        attempt = 0
+        while True:
+            self._check_circuit(model)
+            await self._acquire(model, deadline)
+            started_at = time.monotonic()
+            try:
+                async with self._semaphore:
+                    self.metrics[model]["calls"] += 1
+                    response = await asyncio.wait_for(
+                        self.client.aio.models.generate_content(model=model, **kwargs),
+                        self._remaining(deadline),
+                    )
+                self._record_success(model, started_at)
+                return response
+            except ModelUnavailableError:
+                raise
+            except Exception as e:
+                await self._retry_delay(model, e, attempt, deadline)
+                attempt += 1
+
+    async def generate_content_stream(
+        self, model: str, deadline: Optional[float] = None, **kwargs: Any
+    ) -> AsyncIterator:
+        """
+        Stream generate_content. Calls are only retried before the first
+        chunk arrives, later failures are raised to the caller.
+        """
+        attempt = 0
+        while True:
+            self._check_circuit(model)
+            await self._acquire(model, deadline)
+            started_at = time.monotonic()
+            received = False
+            try:
+                async with self._semaphore:
+                    self.metrics[model]["calls"] += 1
+                    async with contextlib.aclosing(
+                        self._threaded_stream(model, **kwargs)
+                    ) as stream:
+                        while True:
+                            try:
+                                chunk = await asyncio.wait_for(
+                                    anext(stream), self._remaining(deadline)
+                                )
+                            except StopAsyncIteration:
+                                break
+                            received = True
+                            yield chunk
+                self._record_success(model, started_at)
+                return
+            except ModelUnavailableError:
+                raise
+            except Exception as e:
+                if received:
+                    self._breakers[model].record_failure()
+                    self.metrics[model]["failures"] += 1
+                    if isinstance(e, asyncio.TimeoutError):
+                        self.metrics[model]["timeouts"] += 1
+                        raise ModelUnavailableError(
+                            f"{model} stopped answering in the middle of a stream"
+                        ) from e
+                    raise
+                await self._retry_delay(model, e, attempt, deadline)
+                attempt += 1
+
+    async def _threaded_stream(self, model: str, **kwargs: Any) -> AsyncIterator:
+        """
+        Read the sync stream of the client on a worker thread and hand the
+        chunks to the event loop. The aio stream of google-genai 0.6 reads the
+        response with requests on the event loop, which would block every
+        other request of the worker for as long as the model writes.
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stopped = threading.Event()
+
+        def put(item):
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:
+                # The event loop was closed, nobody is listening anymore
+                stopped.set()
+
+        def read():
+            try:
+                for chunk in self.client.models.generate_content_stream(
+                    model=model, **kwargs
+                ):
+                    if stopped.is_set():
+                        return
+                    put(chunk)
+            except Exception as e:
+                put(e)
+            else:
+                put(_END_OF_STREAM)
+
+        threading.Thread(target=read, name=f"stream-{model}", daemon=True).start()
+        try:
+            while True:
+                item = await queue.get()
+                if item is _END_OF_STREAM:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # Stop the reader after its current chunk if we stopped listening
+            stopped.set()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Call counters per model, with the average latency and circuit state"""
+        stats = {}
+        for model, metrics in self.metrics.items():
+            successes = metrics["successes"]
+            stats[model] = {
+                **{counter: metrics[counter] for counter in COUNTERS},
+                "average_seconds": metrics["seconds"] / successes if successes else 0.0,
+                "circuit": self._breakers[model].state,
+            }
+        return stats
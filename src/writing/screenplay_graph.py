@@ -1,75 +1,302 @@
-from typing import TypedDict, Optional, List, Union
+from typing import TypedDict, Optional, List, Union, Callable
 from src.core.settings import settings
+from src.core.cache import TTLCache
+from src.writing.model_gateway import ModelGateway
+from src.writing.screenplay_parser import (
+    ScreenplayParseError,
+    format_screenplay,
+    parse_screenplay,
+)
+import asyncio
+import hashlib
 import re
+import sys
+import time
 from langgraph.graph import Graph
 from google import genai
 from google.genai import types
 from src.writing.template_loader import TemplateLoader
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 
 
 class ScreenplayGenerator:
     """Handles generation of screenplays from images using a workflow graph."""
 
     MIME_TYPE = "image/jpeg"
+    CREATIVE_TEMPERATURE = 0.7
+    STRUCTURE_TEMPERATURE = 0.1
+    # How the raw scene becomes a ScreenplayScene: a second pass with the
+    # Flash model, JSON straight from the creative model, or a local parser
+    # with the Flash model as the fallback
+    STRUCTURE_MODES = ("llm", "json", "parse")
+    PROMPT_TEMPLATES = (
+        "system/screenwriter.txt",
+        "chat/analyze_still.txt",
+        "chat/screenplay_scene.txt",
+        "chat/structure_scene.txt",
+        "chat/detect_genre.txt",
+    )
+
+    def __init__(
+        self,
+        client: genai.Client,
+        prompt_templates: TemplateLoader = None,
+        cache: TTLCache = None,
+        dag: bool = False,
+        gateway: ModelGateway = None,
+        structure_mode: str = "llm",
+    ):
+        """
+        Initialize with a Gemini AI client and compile the workflow graph.
+
+        Args:
+            client: Gemini AI client
+            prompt_templates: Loader for the prompt templates
+            cache: Optional cache for generation results, keyed by image content
+            dag: Run the image analysis and a fast genre detection at the same
+                time, so the scene is written with a known genre
+            gateway: Gateway for the model calls, with rate limits and retries
+            structure_mode: One of STRUCTURE_MODES
+        """
+        if structure_mode not in self.STRUCTURE_MODES:
+            raise ValueError(f"Unknown structure mode: {structure_mode}")
 
-    def __init__(self, client: genai.Client):
-        """Initialize with a Gemini AI client."""
         self.client = client
-        self.prompt_templates = TemplateLoader()
+        self.prompt_templates = prompt_templates or TemplateLoader()
+        self.cache = cache
+        self.dag = dag
+        self.gateway = gateway or ModelGateway(client)
+        self.structure_mode = structure_mode
+
+        # Prompts that don't depend on the scene state are rendered once
+        self.system_prompt = self.prompt_templates.get_template(
+            "system/screenwriter.txt"
+        )
+        self.analysis_prompt = self.prompt_templates.get_template(
+            "chat/analyze_still.txt"
+        )
+        self.genre_prompt = self.prompt_templates.get_template("chat/detect_genre.txt")
 
-    def _generate_scene(self, state: "SceneState") -> "SceneState":
-        """Generate a screenplay scene directly from the image"""
-        # Track which model was used
-        state["models"].add(settings.CREATIVE_MODEL)
+        # Cached results are invalidated whenever a prompt changes
+        self.prompt_hash = self.prompt_templates.source_hash(*self.PROMPT_TEMPLATES)
 
-        scene_prompt = self.prompt_templates.get_template(
-            "chat/screenplay_scene.txt",
-            genre=state.get("genre"),
-            analysis=state.get("analysis", ""),
+        self.workflow = self._build_workflow()
+
+    def _build_workflow(self):
+        """Create the workflow graph and compile it for reuse across requests"""
+        workflow = Graph()
+
+        # Define nodes with bound methods, timing each stage
+        first_node = "prepass" if self.dag else "analyze_still"
+        workflow.add_node(
+            first_node,
+            self._timed(self._prepass if self.dag else self._analyze_still),
+        )
+        workflow.add_node(
+            "generate_scene",
+            self._timed(self._generate_scene),
         )
-        system_prompt = self.prompt_templates.get_template("system/screenwriter.txt")
+        workflow.add_node("structure_scene", self._timed(self._structure_scene))
 
-        response = self.client.models.generate_content(
-            model=settings.CREATIVE_MODEL,
+        workflow.add_edge(first_node, "generate_scene")
+        workflow.add_edge("generate_scene", "structure_scene")
+
+        workflow.set_entry_point(first_node)
+        workflow.set_finish_point("structure_scene")
+
+        return workflow.compile()
+
+    async def _generate_content(self, state: "SceneState", **kwargs):
+        """Call the model through the gateway, within the generation deadline"""
+        return await self.gateway.generate_content(
+            deadline=state.get("deadline"), **kwargs
+        )
+
+    async def _generate_content_stream(self, state: "SceneState", **kwargs):
+        """Stream from the model, see _generate_content()"""
+        async for chunk in self.gateway.generate_content_stream(
+            deadline=state.get("deadline"), **kwargs
+        ):
+            yield chunk
+
+    @staticmethod
+    def _timed(node: Callable) -> Callable:
+        """Wrap a node so its wall time is recorded in state["timings"]"""
+
+        async def timed_node(state: "SceneState") -> "SceneState":
+            start = time.perf_counter()
+            state = await node(state)
+            state["timings"][node.__name__.lstrip("_")] = time.perf_counter() - start
+            return state
+
+        return timed_node
+
+    async def _prepass(self, state: "SceneState") -> "SceneState":
+        """
+        Analyze the image and detect its genre at the same time. Neither needs
+        the other, and the scene is better when both are known up front.
+        """
+        # The genre call is for quality, not speed: it runs alongside the
+        # slower analysis, so it saves no time, and costs a Flash call
+        await asyncio.gather(
+            self._timed(self._analyze_still)(state),
+            self._timed(self._detect_genre)(state),
+        )
+        return state
+
+    async def _detect_genre(self, state: "SceneState") -> "SceneState":
+        """Quickly classify the genre of the image with the Flash model"""
+        # Track which model was used
+        state["models"].add(settings.FLASH_MODEL)
+
+        response = await self._generate_content(
+            state,
+            model=settings.FLASH_MODEL,
             contents=[
                 types.Part.from_bytes(
                     data=state["image_data"], mime_type=self.MIME_TYPE
                 ),
-                scene_prompt,
+                self.genre_prompt,
             ],
             config=types.GenerateContentConfig(
-                system_instruction=system_prompt,
-                temperature=0.7,
+                temperature=self.STRUCTURE_TEMPERATURE,
             ),
         )
+
+        state["genre"] = response.text.strip()
+        return state
+
+    async def _generate_scene(self, state: "SceneState") -> "SceneState":
+        """Generate a screenplay scene directly from the image"""
+        # Track which model was used
+        state["models"].add(settings.CREATIVE_MODEL)
+
+        scene_prompt = self.prompt_templates.get_template(
+            "chat/screenplay_scene.txt",
+            genre=state.get("genre"),
+            analysis=state.get("analysis", ""),
+            structured=self.structure_mode == "json",
+        )
+
+        contents = [
+            types.Part.from_bytes(data=state["image_data"], mime_type=self.MIME_TYPE),
+            scene_prompt,
+        ]
+        config = types.GenerateContentConfig(
+            system_instruction=self.system_prompt,
+            temperature=self.CREATIVE_TEMPERATURE,
+        )
+
+        if self.structure_mode == "json":
+            return await self._generate_structured_scene(state, contents, config)
+
+        # Stream the scene text to the listener while it is being written
+        on_scene_text = state.get("on_scene_text")
+        if on_scene_text:
+            scene_parts = []
+            async for chunk in self._generate_content_stream(
+                state, model=settings.CREATIVE_MODEL, contents=contents, config=config
+            ):
+                if chunk.text:
+                    scene_parts.append(chunk.text)
+                    on_scene_text(chunk.text)
+            state["scene"] = "".join(scene_parts)
+            return state
+
+        response = await self._generate_content(
+            state, model=settings.CREATIVE_MODEL, contents=contents, config=config
+        )
         state["scene"] = response.text
         return state
 
-    def _analyze_still(self, state: "SceneState") -> "SceneState":
+    async def _generate_structured_scene(
+        self, state: "SceneState", contents: list, config: types.GenerateContentConfig
+    ) -> "SceneState":
+        """
+        Generate the scene as JSON in SCREENPLAY_SCHEMA, so it doesn't need a
+        second pass. JSON isn't worth streaming, so the listener gets the
+        scene text at once when it is done.
+        """
+        config = config.model_copy(
+            update={
+                "response_mime_type": "application/json",
+                "response_schema": SCREENPLAY_SCHEMA,
+            }
+        )
+        response = await self._generate_content(
+            state, model=settings.CREATIVE_MODEL, contents=contents, config=config
+        )
+
+        scene_data = ScreenplayScene.model_validate_json(response.text)
+        state["structured_scene"] = scene_data
+        state["scene"] = format_screenplay(scene_data.model_dump())
+
+        on_scene_text = state.get("on_scene_text")
+        if on_scene_text:
+            on_scene_text(state["scene"])
+        return state
+
+    async def _analyze_still(self, state: "SceneState") -> "SceneState":
         """Analyze the image to determine likely genre and related movies"""
         # Track which model was used
         state["models"].add(settings.CREATIVE_MODEL)
 
-        analysis_prompt = self.prompt_templates.get_template("chat/analyze_still.txt")
-
-        response = self.client.models.generate_content(
+        response = await self._generate_content(
+            state,
             model=settings.CREATIVE_MODEL,
             contents=[
                 types.Part.from_bytes(
                     data=state["image_data"], mime_type=self.MIME_TYPE
                 ),
-                analysis_prompt,
+                self.analysis_prompt,
             ],
             config=types.GenerateContentConfig(
-                system_instruction="You're a professional screenwriter", temperature=0.7
+                system_instruction="You're a professional screenwriter",
+                temperature=self.CREATIVE_TEMPERATURE,
             ),
         )
 
         state["analysis"] = response.text
         return state
 
-    def _structure_scene(self, state: "SceneState") -> "SceneState":
+    async def _structure_scene(self, state: "SceneState") -> "SceneState":
+        """Convert raw screenplay text into structured format"""
+        if "structured_scene" in state:
+            # The creative model wrote the structured scene itself
+            scene_data = state["structured_scene"]
+        elif self.structure_mode == "parse":
+            try:
+                scene_data = ScreenplayScene.model_validate(
+                    parse_screenplay(state["scene"], genre=state.get("genre"))
+                )
+            except (ScreenplayParseError, ValidationError) as e:
+                print(
+                    f"Parsing the scene failed, structuring it with "
+                    f"{settings.FLASH_MODEL}: {str(e)}",
+                    file=sys.stderr,
+                )
+                scene_data = await self._structure_with_model(state)
+        else:
+            scene_data = await self._structure_with_model(state)
+        state["genre"] = scene_data.genre
+
+        # Clean up manner and sound fields
+        for element in scene_data.elements:
+            if isinstance(element, DialogueElement) and element.manner:
+                # Remove surrounding parentheses
+                element.manner = re.sub(r"^\(?(.*?)\)?$", r"\1", element.manner)
+                # If manner is now empty or just spaces, set to None
+                if not element.manner.strip():
+                    element.manner = None
+            elif isinstance(element, SoundElement):
+                element.sound = re.sub(r"^\(?(.*?)\)?$", r"\1", element.sound)
+
+        # Store the structured scene
+        state["structured_scene"] = scene_data
+
+        return state
+
+    async def _structure_with_model(self, state: "SceneState") -> "ScreenplayScene":
         """Convert raw screenplay text into structured format using Gemini"""
         # Track which model was used
         state["models"].add(settings.FLASH_MODEL)
@@ -78,79 +305,104 @@ class ScreenplayGenerator:
             "chat/structure_scene.txt", screenplay=state["scene"]
         )
 
-        response = self.client.models.generate_content(
+        response = await self._generate_content(
+            state,
             model=settings.FLASH_MODEL,
             contents=full_prompt,
             config=types.GenerateContentConfig(
-                temperature=0.1,
+                temperature=self.STRUCTURE_TEMPERATURE,
                 response_mime_type="application/json",
                 response_schema=SCREENPLAY_SCHEMA,
             ),
         )
 
         # Parse the response into our Pydantic model
-        scene_data = ScreenplayScene.model_validate_json(response.text)
-        state["genre"] = scene_data.genre
-
-        # Clean up manner and sound fields
-        for element in scene_data.elements:
-            if isinstance(element, DialogueElement) and element.manner:
-                # Remove surrounding parentheses
-                element.manner = re.sub(r"^\(?(.*?)\)?$", r"\1", element.manner)
-                # If manner is now empty or just spaces, set to None
-                if not element.manner.strip():
-                    element.manner = None
-            elif isinstance(element, SoundElement):
-                element.sound = re.sub(r"^\(?(.*?)\)?$", r"\1", element.sound)
+        return ScreenplayScene.model_validate_json(response.text)
+
+    def _cache_key(self, image_data: bytes) -> tuple:
+        """Everything that determines the outcome of a generation"""
+        return (
+            hashlib.sha256(image_data).hexdigest(),
+            settings.CREATIVE_MODEL,
+            settings.FLASH_MODEL,
+            self.prompt_hash,
+            self.CREATIVE_TEMPERATURE,
+            self.STRUCTURE_TEMPERATURE,
+            self.dag,
+            self.structure_mode,
+        )
 
-        # Store the structured scene
-        state["structured_scene"] = scene_data
+    def _cached_state(self, cache_key: tuple) -> Optional["SceneState"]:
+        """Build a final state from a cached result, if there is one"""
+        cached = self.cache.get(cache_key)
+        if cached is None:
+            return None
+
+        return {
+            "scene": cached["scene"],
+            "analysis": cached["analysis"],
+            "genre": cached["genre"],
+            "structured_scene": cached["structured_scene"].model_copy(deep=True),
+            "models": set(cached["models"]),
+            "timings": {},
+            "cached": True,
+        }
 
-        return state
+    def _cache_state(self, cache_key: tuple, state: "SceneState"):
+        """Store the outcome of a generation for reuse"""
+        self.cache.set(
+            cache_key,
+            {
+                "scene": state["scene"],
+                "analysis": state.get("analysis"),
+                "genre": state.get("genre"),
+                "structured_scene": state["structured_scene"].model_copy(deep=True),
+                "models": frozenset(state["models"]),
+            },
+        )
 
     async def generate_from_image(
         self,
         image_data,
+        on_scene_text: Optional[Callable[[str], None]] = None,
+        use_cache: bool = True,
     ) -> "SceneState":
         """
         Generate a complete screenplay from an image
 
         Args:
             image_data Raw image bytes
+            on_scene_text Optional callback, streams the raw scene text as it
+                is generated
+            use_cache If False, always generate a fresh screenplay (the result
+                still replaces the cached one)
 
         Returns:
             SceneState containing the generated screenplay and metadata
         """
+        cache_key = self._cache_key(image_data) if self.cache is not None else None
+        if cache_key and use_cache:
+            cached_state = self._cached_state(cache_key)
+            if cached_state:
+                if on_scene_text:
+                    on_scene_text(cached_state["scene"])
+                return cached_state
+
         # Initialize the graph state
         initial_state: SceneState = {
             "scene": "",
             "models": set(),
+            "timings": {},
+            "deadline": time.monotonic() + settings.GENERATION_DEADLINE,
             "image_data": image_data,
+            "on_scene_text": on_scene_text,
         }
 
-        # Create and run the workflow
-        workflow = Graph()
-
-        # Define nodes with bound methods
-        workflow.add_node(
-            "analyze_still",
-            self._analyze_still,
-        )
-        workflow.add_node(
-            "generate_scene",
-            self._generate_scene,
-        )
-        workflow.add_node("structure_scene", self._structure_scene)
-
-        workflow.add_edge("analyze_still", "generate_scene")
-        workflow.add_edge("generate_scene", "structure_scene")
-
-        workflow.set_entry_point("analyze_still")
-        workflow.set_finish_point("structure_scene")
-
-        # Run the workflow and return the final state
-        runnable = workflow.compile()
-        return await runnable.ainvoke(initial_state)
+        # Run the precompiled workflow and return the final state
+        final_state = await self.workflow.ainvoke(initial_state)
+        if cache_key:
+            self._cache_state(cache_key, final_state)
+        return final_state
 
 
 class DialogueElement(BaseModel):
@@ -189,6 +441,10 @@ class SceneState(TypedDict):
     structured_scene: ScreenplayScene
     analysis: Optional[str] = None
     models: set[str] = set()
+    timings: dict[str, float] = {}
+    deadline: Optional[float] = None
+    on_scene_text: Optional[Callable[[str], None]] = None
+    cached: bool = False
 
 
 # Response schema for the structure_scene method
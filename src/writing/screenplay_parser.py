@@ -0,0 +1,206 @@
+"""Deterministic parser for the raw screenplay text the creative model writes."""
+
+import re
+from typing import Any, Dict, List, Optional
+
+# INT. CAFE - DAY, EXT./INT. STREET - NIGHT, I/E. CAR - DAY
+HEADING_RE = re.compile(r"^(INT\.?/EXT\.?|EXT\.?/INT\.?|I/E\.?|INT\.|EXT\.)\s*\S")
+# CUT TO:, FADE OUT., FADE TO BLACK., SMASH CUT TO:
+TRANSITION_RE = re.compile(r"^[A-Z][A-Z .'-]*(\bTO:|\bTO BLACK\.?|\bOUT\.?)$")
+OPENING_RE = re.compile(r"^FADE IN:?$")
+# BO, DR. MARTIN (V.O.), MRS. O'NEILL (CONT'D)
+CUE_RE = re.compile(r"^([A-Z0-9][A-Z0-9 .'&-]*?)(\s*\([A-Z0-9 .'’]+\))*$")
+# BO: Hi there, BO (softly): Hi there
+INLINE_DIALOGUE_RE = re.compile(r"^([A-Z][A-Z0-9 .'&-]*?)\s*(?:\(([^)]*)\))?:\s+(.+)$")
+SOUND_RE = re.compile(r"^(?:SFX|SOUNDS?|SOUND EFFECTS?)\s*:\s*(.+)$", re.IGNORECASE)
+PARENTHETICAL_RE = re.compile(r"^\((.*)\)$")
+LABEL_RE = re.compile(r"^(genre|scene)\s*:\s*(.*)$", re.IGNORECASE)
+MARKDOWN_RE = re.compile(r"^#+\s*|\*\*|__|^\s*>\s?")
+
+# The field of each element type that a continuation line is added to
+TEXT_FIELDS = {"visual": "visual", "sound": "sound", "dialogue": "line"}
+
+
+class ScreenplayParseError(ValueError):
+    """Raised when the text doesn't follow the screenplay format closely enough"""
+
+
+def _clean_lines(text: str) -> List[str]:
+    """Strip code fences and markdown emphasis, which models like to add"""
+    lines = []
+    for line in text.splitlines():
+        line = MARKDOWN_RE.sub("", line.strip()).strip()
+        if not line.startswith("```"):
+            lines.append(line)
+    return lines
+
+
+def _blocks(lines: List[str]) -> List[List[str]]:
+    """Group lines into paragraphs, separated by blank lines"""
+    blocks, block = [], []
+    for line in lines:
+        if line:
+            block.append(line)
+        elif block:
+            blocks.append(block)
+            block = []
+    if block:
+        blocks.append(block)
+    return blocks
+
+
+def _starts_element(line: str) -> bool:
+    """Whether a line starts an element, whatever comes before it"""
+    return any(
+        regex.match(line)
+        for regex in (
+            HEADING_RE,
+            OPENING_RE,
+            TRANSITION_RE,
+            SOUND_RE,
+            INLINE_DIALOGUE_RE,
+        )
+    )
+
+
+def _is_cue(line: str) -> bool:
+    # SILENCE. or THE DOOR SLAMS! is an action line, not a character
+    return (
+        len(line) <= 40
+        and not line.endswith((".", "!", "?"))
+        and any(c.isalpha() for c in line)
+        and CUE_RE.match(line) is not None
+        and not HEADING_RE.match(line)
+        and not TRANSITION_RE.match(line)
+    )
+
+
+def _dialogue(block: List[str]) -> List[Dict[str, Any]]:
+    """Dialogue elements for a character cue followed by its lines"""
+    character = CUE_RE.match(block[0]).group(1).strip()
+    elements = []
+    manner, line = None, []
+    for text in block[1:]:
+        parenthetical = PARENTHETICAL_RE.match(text)
+        if parenthetical:
+            # A parenthetical in the middle of a speech starts a new element
+            if line:
+                elements.append(_speech(character, line, manner))
+                line = []
+            manner = parenthetical.group(1).strip()
+        else:
+            line.append(text)
+    if not line:
+        raise ScreenplayParseError(f"{character} has no dialogue")
+    elements.append(_speech(character, line, manner))
+    return elements
+
+
+def _speech(character: str, line: List[str], manner: Optional[str]) -> Dict:
+    element = {"type": "dialogue", "character": character, "line": " ".join(line)}
+    if manner:
+        element["manner"] = manner
+    return element
+
+
+def parse_screenplay(text: str, genre: str = None) -> Dict[str, Any]:
+    """
+    Parse raw screenplay text into a dict in the shape of SCREENPLAY_SCHEMA.
+
+    The text is expected in the format the scene prompt asks for: a "Genre:"
+    line, a "Scene:" line and the scene in screenplay format. genre is used
+    when the text has no genre line. Raises ScreenplayParseError when the
+    text can't be parsed without guessing.
+    """
+    scene_heading = None
+    elements = []
+
+    lines = []
+    for line in _clean_lines(text):
+        label = LABEL_RE.match(line)
+        if label and label.group(1).lower() == "genre":
+            genre = label.group(2).strip() or genre
+        elif label:
+            # The scene may start on the same line as its label
+            lines.append(label.group(2).strip())
+        else:
+            lines.append(line)
+
+    for block in _blocks(lines):
+        # Lines are classified one by one, models don't always separate the
+        # elements of a scene with blank lines
+        current = None
+        i = 0
+        while i < len(block):
+            line = block[i]
+            if HEADING_RE.match(line):
+                if scene_heading:
+                    raise ScreenplayParseError("The text has more than one scene")
+                scene_heading = line
+                current = None
+            elif OPENING_RE.match(line):
+                current = None
+            elif TRANSITION_RE.match(line):
+                elements.append({"type": "scene_ending", "transition": line})
+                current = None
+            elif SOUND_RE.match(line):
+                current = {"type": "sound", "sound": SOUND_RE.match(line).group(1)}
+                elements.append(current)
+            elif INLINE_DIALOGUE_RE.match(line):
+                character, manner, text = INLINE_DIALOGUE_RE.match(line).groups()
+                current = _speech(character.strip(), [text], manner)
+                elements.append(current)
+            elif _is_cue(line):
+                # The speech runs until the end of the block or the next element
+                end = i + 1
+                while end < len(block) and not _starts_element(block[end]):
+                    end += 1
+                if end == i + 1:
+                    # Likely a speech after a blank line, which can't be told
+                    # apart from an action line without guessing
+                    raise ScreenplayParseError(f"{line} has no dialogue")
+                elements.extend(_dialogue(block[i:end]))
+                current = None
+                i = end
+                continue
+            elif current:
+                # A line that continues the previous element
+                field = TEXT_FIELDS[current["type"]]
+                current[field] = f"{current[field]} {line}"
+            else:
+                current = {"type": "visual", "visual": line}
+                elements.append(current)
+            i += 1
+
+    if not genre:
+        raise ScreenplayParseError("The text has no genre")
+    if not scene_heading:
+        raise ScreenplayParseError("The text has no scene heading")
+    if not elements:
+        raise ScreenplayParseError("The scene is empty")
+    return {"genre": genre, "scene_heading": scene_heading, "elements": elements}
+
+
+def format_screenplay(scene: Dict[str, Any]) -> str:
+    """Write a structured scene as raw screenplay text, see parse_screenplay()"""
+    blocks = [f"Genre: {scene['genre']}\nScene:\n{scene['scene_heading']}"]
+    for element in scene["elements"]:
+        kind = element["type"]
+        if kind == "dialogue":
+            manner = element.get("manner")
+            blocks.append(
+                "\n".join(
+                    [
+                        element["character"].upper(),
+                        *([f"({manner})"] if manner else []),
+                        element["line"],
+                    ]
+                )
+            )
+        elif kind == "sound":
+            blocks.append(f"SFX: {element['sound']}")
+        elif kind == "scene_ending":
+            blocks.append(element["transition"].upper())
+        else:
+            blocks.append(element["visual"])
+    return "\n\n".join(blocks)
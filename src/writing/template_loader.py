@@ -1,5 +1,6 @@
 """Template loading and management functionality."""
 
+import hashlib
 from pathlib import Path
 from typing import Dict, Optional, Any
 from jinja2 import Template, Environment, FileSystemLoader
@@ -39,6 +40,23 @@ class TemplateLoader:
         except Exception:
             return None
 
+    def source_hash(self, *template_paths: str) -> str:
+        """
+        Compute a SHA256 hash over the sources of the given templates.
+
+        Args:
+            *template_paths: Paths relative to root_dir
+
+        Returns:
+            Hex digest that changes whenever one of the templates changes
+        """
+        digest = hashlib.sha256()
+        for template_path in template_paths:
+            source, _, _ = self.env.loader.get_source(self.env, template_path)
+            digest.update(template_path.encode())
+            digest.update(source.encode())
+        return digest.hexdigest()
+
     def clear_cache(self):
         """Clear the template cache."""
         self._cache.clear()
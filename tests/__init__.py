@@ -0,0 +1,16 @@
+"""
+Tests that run without Google Cloud, against fake clients.
+
+Run them from the project root with: poetry run python -m unittest
+"""
+
+import os
+
+# Settings that are required but never used by the code under test
+for name, value in {
+    "PROJECT_ID": "test-project",
+    "BUCKET_NAME": "test-bucket",
+    "GOOGLE_CLIENT_ID": "test-client-id",
+    "JWT_SECRET": "test-secret-that-is-at-least-32-bytes",
+}.items():
+    os.environ.setdefault(name, value)
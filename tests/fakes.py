@@ -0,0 +1,66 @@
+"""Fake Gemini client with artificial latency."""
+
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+SCENE_TEXT = "Genre: Comedy\nScene:\nINT. CAFE - DAY\n\nA cat.\n\nBO\n(softly)\nHi"
+
+SCENE_JSON = json.dumps(
+    {
+        "genre": "Comedy",
+        "scene_heading": "INT. CAFE - DAY",
+        "elements": [
+            {"type": "visual", "visual": "A cat."},
+            {"type": "dialogue", "character": "BO", "line": "Hi", "manner": "softly"},
+        ],
+    }
+)
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+def _response_text(config) -> str:
+    if getattr(config, "response_mime_type", None) == "application/json":
+        return SCENE_JSON
+    return SCENE_TEXT
+
+
+class FakeAsyncModels:
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.calls = []
+
+    async def generate_content(self, model, contents, config=None):
+        self.calls.append(model)
+        await asyncio.sleep(self.delay)
+        return FakeResponse(_response_text(config))
+
+
+class FakeModels:
+    """The sync API, its stream blocks between chunks like requests does"""
+
+    def __init__(self, delay: float, chunks: int = 3):
+        self.delay = delay
+        self.chunks = chunks
+        self.calls = []
+
+    def generate_content_stream(self, model, contents, config=None):
+        self.calls.append(model)
+        text = _response_text(config)
+        size = -(-len(text) // self.chunks)
+        for start in range(0, len(text), size):
+            time.sleep(self.delay / self.chunks)
+            yield FakeResponse(text[start : start + size])
+
+
+class FakeGenaiClient:
+    """Answers every call after delay seconds"""
+
+    def __init__(self, delay: float = 0.1):
+        self.models = FakeModels(delay)
+        self.aio = SimpleNamespace(models=FakeAsyncModels(delay))
@@ -0,0 +1,141 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+from src.jobs.generation_queue import GenerationQueue, JobStatus, QueueFullError
+from src.jobs.job_store import MemoryJobStore
+
+
+class FakeGenerator:
+    """Takes delay seconds per screenplay, fails for image data b"fail" """
+
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    async def generate_from_image(self, image_data, on_scene_text=None, **kwargs):
+        await asyncio.sleep(self.delay)
+        if image_data == b"fail":
+            raise ValueError("generation failed")
+        structured_scene = SimpleNamespace(model_dump=lambda: {"elements": []})
+        return {
+            "scene": "INT. CAFE - DAY",
+            "structured_scene": structured_scene,
+            "genre": "Comedy",
+            "models": {},
+        }
+
+
+class FakeScreenplayStore:
+    def __init__(self):
+        self.stored = []
+
+    async def store_screenplay(self, screenplay_data, image_id, author=None):
+        self.stored.append(image_id)
+        return f"screenplay-{image_id}"
+
+
+def queue(delay: float = 0.05, **kwargs) -> GenerationQueue:
+    return GenerationQueue(
+        FakeGenerator(delay), FakeScreenplayStore(), concurrency=2, **kwargs
+    )
+
+
+async def submit(generation_queue: GenerationQueue, image_id: str = "image", **kwargs):
+    kwargs = {"image_data": b"image data", **kwargs}
+    return await generation_queue.submit("user", image_id, **kwargs)
+
+
+async def finished(job):
+    while not job.finished:
+        await job.wait_for_update(timeout=1)
+    return job
+
+
+class GenerationQueueTest(unittest.IsolatedAsyncioTestCase):
+    async def test_runs_jobs(self):
+        generation_queue = queue()
+        generation_queue.start()
+        job = await submit(generation_queue)
+        self.assertEqual(job.status, JobStatus.QUEUED)
+
+        await finished(job)
+        await generation_queue.stop()
+        self.assertEqual(job.status, JobStatus.DONE)
+        self.assertEqual(job.screenplay_id, "screenplay-image")
+        self.assertEqual(job.image_data, b"")
+
+    async def test_waits_for_the_image_when_generation_fails(self):
+        async def store_image():
+            await asyncio.sleep(0.1)
+
+        generation_queue = queue(delay=0)
+        generation_queue.start()
+        image_stored = asyncio.create_task(store_image())
+        job = await submit(
+            generation_queue, image_data=b"fail", image_stored=image_stored
+        )
+        await generation_queue.stop(timeout=1)
+        self.assertEqual(job.status, JobStatus.FAILED)
+        self.assertTrue(image_stored.done())
+
+    async def test_fails_when_the_image_is_not_stored(self):
+        async def store_image():
+            raise OSError("upload failed")
+
+        generation_queue = queue(delay=0)
+        generation_queue.start()
+        image_stored = asyncio.create_task(store_image())
+        job = await finished(await submit(generation_queue, image_stored=image_stored))
+        await generation_queue.stop()
+        self.assertEqual(job.status, JobStatus.FAILED)
+        self.assertEqual(generation_queue.screenplay_store.stored, [])
+
+    async def test_other_instances_see_the_job(self):
+        job_store = MemoryJobStore()
+        generation_queue = queue(job_store=job_store)
+        other_queue = queue(job_store=job_store)
+        generation_queue.start()
+        job = await submit(generation_queue)
+
+        seen = await other_queue.get_job(job.id)
+        self.assertFalse(other_queue.is_local(seen))
+        self.assertEqual((seen.user_id, seen.status), ("user", JobStatus.QUEUED))
+
+        await generation_queue.stop(timeout=1)
+        seen = await other_queue.get_job(job.id)
+        self.assertEqual(seen.status, JobStatus.DONE)
+        self.assertEqual(seen.screenplay_id, "screenplay-image")
+        self.assertIsNone(await other_queue.get_job("unknown"))
+
+    async def test_stop_lets_running_jobs_finish(self):
+        generation_queue = queue()
+        generation_queue.start()
+        jobs = [await submit(generation_queue, f"image-{i}") for i in range(3)]
+        await generation_queue.stop(timeout=1)
+        self.assertEqual([job.status for job in jobs], [JobStatus.DONE] * 3)
+
+    async def test_stop_fails_unfinished_jobs(self):
+        job_store = MemoryJobStore()
+        generation_queue = queue(delay=1, job_store=job_store)
+        generation_queue.start()
+        job = await submit(generation_queue)
+        await generation_queue.stop(timeout=0.05)
+
+        self.assertEqual(job.status, JobStatus.FAILED)
+        record = await job_store.get(job.id)
+        self.assertEqual(record["status"], JobStatus.FAILED.value)
+        self.assertTrue(record["error"])
+
+        # No new jobs are taken once the queue stops
+        self.assertTrue(generation_queue.is_full())
+        with self.assertRaises(QueueFullError):
+            await submit(generation_queue)
+
+
+class MemoryJobStoreTest(unittest.IsolatedAsyncioTestCase):
+    async def test_expires_records(self):
+        job_store = MemoryJobStore()
+        await job_store.save("old", {"status": "done"}, ttl=0.01)
+        await job_store.save("new", {"status": "done"}, ttl=10)
+        await asyncio.sleep(0.02)
+        self.assertIsNone(await job_store.get("old"))
+        self.assertEqual(await job_store.get("new"), {"status": "done"})
@@ -0,0 +1,114 @@
+import json
+import time
+import unittest
+from unittest import mock
+import requests
+import rsa
+from google.auth import crypt
+from google.auth import jwt as google_jwt
+from src.auth.google_certs import GoogleTokenVerifier
+
+CLIENT_ID = "test-client-id"
+
+
+def generate_key(key_id: str) -> tuple[crypt.RSASigner, str]:
+    """A signer and the PEM public key to publish in the key set"""
+    public_key, private_key = rsa.newkeys(1024)
+    signer = crypt.RSASigner.from_string(private_key.save_pkcs1(), key_id=key_id)
+    return signer, public_key.save_pkcs1().decode()
+
+
+class StubCertsSession:
+    """Serves a key set like https://www.googleapis.com/oauth2/v1/certs"""
+
+    def __init__(self, certs: dict, cache_control: str = "public, max-age=3600"):
+        self.certs = certs
+        self.cache_control = cache_control
+        self.fail = False
+        self.requests = 0
+
+    def request(self, method, url, **kwargs):
+        self.requests += 1
+        response = requests.Response()
+        response.status_code = 503 if self.fail else 200
+        response.headers["Cache-Control"] = self.cache_control
+        response._content = json.dumps(self.certs).encode()
+        return response
+
+    def close(self):
+        pass
+
+
+def sign_token(signer: crypt.RSASigner, **claims) -> str:
+    now = int(time.time())
+    payload = {
+        "iss": "https://accounts.google.com",
+        "aud": CLIENT_ID,
+        "sub": "1234",
+        "email": "ada@example.com",
+        "iat": now,
+        "exp": now + 3600,
+        **claims,
+    }
+    return google_jwt.encode(signer, payload).decode()
+
+
+class GoogleTokenVerifierTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.signer, cls.public_key = generate_key("key-1")
+        cls.new_signer, cls.new_public_key = generate_key("key-2")
+
+    def verifier(self, session: StubCertsSession) -> GoogleTokenVerifier:
+        return GoogleTokenVerifier(CLIENT_ID, session=session)
+
+    def test_logins_share_one_certs_fetch(self):
+        session = StubCertsSession({"key-1": self.public_key})
+        verifier = self.verifier(session)
+        tokens = [sign_token(self.signer, sub=str(i)) for i in range(50)]
+
+        start = time.perf_counter()
+        for i, token in enumerate(tokens):
+            self.assertEqual(verifier.verify(token)["sub"], str(i))
+        per_second = len(tokens) / (time.perf_counter() - start)
+
+        self.assertEqual(session.requests, 1, f"{per_second:.0f} logins/s")
+
+    def test_certs_expire_with_max_age(self):
+        session = StubCertsSession({"key-1": self.public_key}, "max-age=0")
+        verifier = self.verifier(session)
+        verifier.verify(sign_token(self.signer))
+        verifier.verify(sign_token(self.signer))
+        self.assertEqual(session.requests, 2)
+
+    def test_unknown_key_refreshes_the_certs(self):
+        session = StubCertsSession({"key-1": self.public_key})
+        verifier = self.verifier(session)
+        verifier.verify(sign_token(self.signer))
+
+        # Google rotates its keys
+        session.certs = {"key-2": self.new_public_key}
+        with mock.patch("src.auth.google_certs.MIN_REFRESH_INTERVAL", 0):
+            verifier.verify(sign_token(self.new_signer))
+        self.assertEqual(session.requests, 2)
+
+    def test_keeps_the_certs_when_a_refresh_fails(self):
+        session = StubCertsSession({"key-1": self.public_key}, "max-age=0")
+        verifier = self.verifier(session)
+        verifier.verify(sign_token(self.signer))
+
+        session.fail = True
+        verifier.verify(sign_token(self.signer))
+        self.assertEqual(session.requests, 2)
+
+    def test_rejects_other_audiences_and_issuers(self):
+        verifier = self.verifier(StubCertsSession({"key-1": self.public_key}))
+        with self.assertRaises(ValueError):
+            verifier.verify(sign_token(self.signer, aud="another-client"))
+        with self.assertRaises(ValueError):
+            verifier.verify(sign_token(self.signer, iss="https://example.com"))
+
+    def test_rejects_unknown_signers(self):
+        verifier = self.verifier(StubCertsSession({"key-1": self.public_key}))
+        with self.assertRaises(ValueError):
+            verifier.verify(sign_token(self.new_signer))
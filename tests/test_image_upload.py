@@ -0,0 +1,74 @@
+import hashlib
+import io
+import os
+import tempfile
+import unittest
+from fastapi import UploadFile
+from PIL import Image
+from src.storage.image_processing import (
+    IMAGE_SIZES,
+    ImageProcessingError,
+    ImageTooLargeError,
+    ImageWorkerPool,
+    ImageWorkersBusyError,
+)
+from src.storage.image_upload import ingest_upload
+
+
+def png(width: int = 64, height: int = 48) -> bytes:
+    output = io.BytesIO()
+    Image.new("RGB", (width, height), "red").save(output, format="PNG")
+    return output.getvalue()
+
+
+def upload(data: bytes) -> UploadFile:
+    """An upload the way Starlette spools it, on disk above 1 KB here"""
+    file = tempfile.SpooledTemporaryFile(max_size=1024)
+    file.write(data)
+    return UploadFile(file, filename="upload")
+
+
+async def ingest(data: bytes, max_bytes: int = 1024 * 1024, max_pixels: int = 10**6):
+    return await ingest_upload(
+        upload(data), max_bytes=max_bytes, max_pixels=max_pixels, chunk_size=512
+    )
+
+
+class IngestUploadTest(unittest.IsolatedAsyncioTestCase):
+    async def test_accepts_images(self):
+        data = png()
+        image = await ingest(data)
+        self.assertEqual(image.data, data)
+        self.assertEqual(image.content_type, "image/png")
+        self.assertEqual(image.file_hash, hashlib.sha256(data).hexdigest())
+
+    async def test_sniffs_the_type(self):
+        with self.assertRaises(ImageProcessingError):
+            await ingest(b"<html>" + png())
+
+    async def test_rejects_empty_files(self):
+        with self.assertRaises(ImageProcessingError):
+            await ingest(b"")
+
+    async def test_rejects_large_files(self):
+        data = png(512, 512)
+        with self.assertRaises(ImageTooLargeError):
+            await ingest(data, max_bytes=len(data) - 1)
+
+    async def test_rejects_large_images_by_their_header(self):
+        with self.assertRaises(ImageTooLargeError):
+            await ingest(png(200, 200), max_pixels=100 * 100)
+
+
+class ImageWorkerPoolTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.pool = ImageWorkerPool(max_workers=1)
+        self.addCleanup(self.pool.shutdown)
+
+    async def test_recovers_from_a_dead_worker(self):
+        with self.assertRaises(ImageWorkersBusyError):
+            await self.pool._run(os._exit, 1)
+        derivatives = await self.pool.create_derivatives(
+            png(), {"thumb": IMAGE_SIZES["thumb"]}, ["jpeg"]
+        )
+        self.assertEqual(list(derivatives), [("thumb", "jpeg")])
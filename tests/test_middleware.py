@@ -0,0 +1,56 @@
+import unittest
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+from src.core.middleware import FORM_OVERHEAD_BYTES, BodySizeLimitMiddleware
+
+MAX_UPLOAD_BYTES = 1024
+
+
+def client() -> TestClient:
+    app = FastAPI()
+    app.add_middleware(BodySizeLimitMiddleware, max_upload_bytes=MAX_UPLOAD_BYTES)
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        return {"size": len(await file.read())}
+
+    return TestClient(app)
+
+
+def chunked(data: bytes, chunk_size: int = 1024):
+    """A body without Content-Length, sent in chunks"""
+    for offset in range(0, len(data), chunk_size):
+        yield data[offset : offset + chunk_size]
+
+
+class BodySizeLimitTest(unittest.TestCase):
+    def test_accepts_small_uploads(self):
+        response = client().post("/upload", files={"file": b"x" * MAX_UPLOAD_BYTES})
+        self.assertEqual(response.json(), {"size": MAX_UPLOAD_BYTES})
+
+    def test_rejects_large_content_length(self):
+        response = client().post(
+            "/upload", files={"file": b"x" * (MAX_UPLOAD_BYTES + FORM_OVERHEAD_BYTES)}
+        )
+        self.assertEqual(response.status_code, 413)
+
+    def test_counts_the_bytes_of_chunked_bodies(self):
+        body = b"x" * (MAX_UPLOAD_BYTES + FORM_OVERHEAD_BYTES + 1)
+        response = client().post(
+            "/upload",
+            content=chunked(body),
+            headers={"content-type": "multipart/form-data; boundary=b"},
+        )
+        self.assertEqual(response.status_code, 413)
+
+    def test_body_that_lies_about_its_length(self):
+        body = b"x" * (MAX_UPLOAD_BYTES + FORM_OVERHEAD_BYTES + 1)
+        response = client().post(
+            "/upload",
+            content=chunked(body),
+            headers={
+                "content-type": "multipart/form-data; boundary=b",
+                "content-length": "10",
+            },
+        )
+        self.assertEqual(response.status_code, 413)
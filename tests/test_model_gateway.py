@@ -0,0 +1,218 @@
+import asyncio
+import collections
+import time
+import unittest
+from types import SimpleNamespace
+import requests
+from google.genai import errors
+from src.core.ratelimit import TokenBucket
+from src.writing.model_gateway import ModelGateway, ModelUnavailableError
+from tests.fakes import FakeResponse
+
+MODEL = "test-model"
+
+
+def api_error(code: int) -> errors.APIError:
+    response = SimpleNamespace(body_segments=[{"error": {"message": "fake"}}])
+    error_class = errors.ClientError if code < 500 else errors.ServerError
+    return error_class(code, response)
+
+
+class ScriptedModels:
+    """Raises or answers according to a script, one entry per call"""
+
+    def __init__(self, script: list, delay: float = 0):
+        self.script = list(script)
+        self.delay = delay
+        self.calls = 0
+
+    def _next(self):
+        self.calls += 1
+        outcome = self.script.pop(0) if self.script else "ok"
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    async def generate_content(self, model, contents, config=None):
+        await asyncio.sleep(self.delay)
+        return FakeResponse(self._next())
+
+    def generate_content_stream(self, model, contents, config=None):
+        for text in self._next().split():
+            yield FakeResponse(text)
+            # The script continues after the first chunk
+            if self.script and isinstance(self.script[0], Exception):
+                raise self.script.pop(0)
+
+
+class QuotaModels:
+    """Allows quota calls per model per second, answers 429 above that"""
+
+    def __init__(self, quota: int):
+        self.quota = quota
+        self.accepted = collections.defaultdict(collections.deque)
+        self.throttled = 0
+
+    async def generate_content(self, model, contents, config=None):
+        now = time.monotonic()
+        accepted = self.accepted[model]
+        while accepted and now - accepted[0] > 1:
+            accepted.popleft()
+        if len(accepted) >= self.quota:
+            self.throttled += 1
+            raise api_error(429)
+        accepted.append(now)
+        return FakeResponse("ok")
+
+
+def gateway(models, **kwargs) -> ModelGateway:
+    client = SimpleNamespace(models=models, aio=SimpleNamespace(models=models))
+    kwargs = {"base_delay": 0.01, "max_delay": 0.05, **kwargs}
+    return ModelGateway(client, **kwargs)
+
+
+async def generate(model_gateway: ModelGateway, **kwargs):
+    return await model_gateway.generate_content(MODEL, contents="x", **kwargs)
+
+
+class TokenBucketTest(unittest.IsolatedAsyncioTestCase):
+    async def test_waits_for_tokens(self):
+        bucket = TokenBucket(rate=20, capacity=1)
+        start = time.monotonic()
+        for _ in range(5):
+            await bucket.acquire()
+        # The first token is available right away
+        self.assertGreaterEqual(time.monotonic() - start, 4 / 20 * 0.9)
+
+    async def test_drain_delays_the_next_call(self):
+        bucket = TokenBucket(rate=10, capacity=5)
+        bucket.drain()
+        start = time.monotonic()
+        await bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 1 / 10 * 0.9)
+
+
+class RetryTest(unittest.IsolatedAsyncioTestCase):
+    def test_retryable_errors(self):
+        for error in (
+            api_error(429),
+            api_error(500),
+            api_error(503),
+            asyncio.TimeoutError(),
+            requests.exceptions.ConnectionError(),
+        ):
+            self.assertTrue(ModelGateway._is_retryable(error), error)
+        for error in (api_error(400), api_error(404), ValueError()):
+            self.assertFalse(ModelGateway._is_retryable(error), error)
+
+    async def test_retries_throttled_calls(self):
+        models = ScriptedModels([api_error(429), api_error(503)])
+        model_gateway = gateway(models)
+        response = await generate(model_gateway)
+        self.assertEqual(response.text, "ok")
+        stats = model_gateway.stats()[MODEL]
+        self.assertEqual((stats["retries"], stats["throttled"]), (2, 1))
+
+    async def test_raises_other_errors_unchanged(self):
+        models = ScriptedModels([api_error(400)])
+        with self.assertRaises(errors.ClientError):
+            await generate(gateway(models))
+        self.assertEqual(models.calls, 1)
+
+    async def test_gives_up_after_max_retries(self):
+        models = ScriptedModels([api_error(503)] * 3)
+        with self.assertRaises(ModelUnavailableError):
+            await generate(gateway(models, max_retries=2))
+        self.assertEqual(models.calls, 3)
+
+    async def test_deadline(self):
+        models = ScriptedModels([], delay=1)
+        start = time.monotonic()
+        with self.assertRaises(ModelUnavailableError):
+            await generate(gateway(models), deadline=time.monotonic() + 0.2)
+        self.assertLess(time.monotonic() - start, 0.5)
+
+    async def test_stream_retries_before_the_first_chunk(self):
+        models = ScriptedModels([api_error(503), "one two"])
+        stream = gateway(models).generate_content_stream(MODEL, contents="x")
+        self.assertEqual([chunk.text async for chunk in stream], ["one", "two"])
+
+    async def test_stream_fails_after_the_first_chunk(self):
+        models = ScriptedModels(["one two", api_error(503)])
+        chunks = []
+        with self.assertRaises(errors.ServerError):
+            async for chunk in gateway(models).generate_content_stream(
+                MODEL, contents="x"
+            ):
+                chunks.append(chunk.text)
+        self.assertEqual((chunks, models.calls), (["one"], 1))
+
+
+class CircuitBreakerTest(unittest.IsolatedAsyncioTestCase):
+    async def test_opens_and_closes(self):
+        models = ScriptedModels([api_error(503)] * 3)
+        model_gateway = gateway(
+            models, max_retries=0, failure_threshold=2, reset_timeout=0.1
+        )
+        breaker = model_gateway._breakers[MODEL]
+
+        for _ in range(2):
+            with self.assertRaises(ModelUnavailableError):
+                await generate(model_gateway)
+        self.assertEqual(breaker.state, "open")
+
+        # Rejected without calling the model
+        with self.assertRaises(ModelUnavailableError):
+            await generate(model_gateway)
+        self.assertEqual(models.calls, 2)
+
+        # A failed trial call opens the circuit again
+        await asyncio.sleep(0.1)
+        self.assertEqual(breaker.state, "half-open")
+        with self.assertRaises(ModelUnavailableError):
+            await generate(model_gateway)
+        self.assertEqual(breaker.state, "open")
+
+        # A successful one closes it
+        await asyncio.sleep(0.1)
+        await generate(model_gateway)
+        self.assertEqual(breaker.state, "closed")
+        self.assertEqual(model_gateway.stats()[MODEL]["rejected"], 1)
+
+    async def test_one_trial_call_at_a_time(self):
+        models = ScriptedModels([api_error(503)], delay=0.05)
+        model_gateway = gateway(
+            models, max_retries=0, failure_threshold=1, reset_timeout=0.1
+        )
+        with self.assertRaises(ModelUnavailableError):
+            await generate(model_gateway)
+
+        await asyncio.sleep(0.1)
+        results = await asyncio.gather(
+            generate(model_gateway), generate(model_gateway), return_exceptions=True
+        )
+        self.assertEqual(results[0].text, "ok")
+        self.assertIsInstance(results[1], ModelUnavailableError)
+
+
+class ThrottlingTest(unittest.IsolatedAsyncioTestCase):
+    """Calls from a burst against a model with a quota of 10 calls per second"""
+
+    async def burst(self, model_gateway: ModelGateway, calls: int = 20):
+        return await asyncio.gather(
+            *[generate(model_gateway) for _ in range(calls)], return_exceptions=True
+        )
+
+    async def test_without_rate_limit(self):
+        models = QuotaModels(quota=10)
+        model_gateway = gateway(models, max_retries=0)
+        await self.burst(model_gateway)
+        self.assertEqual(models.throttled, 10)
+        # Throttling doesn't open the circuit
+        self.assertEqual(model_gateway.stats()[MODEL]["circuit"], "closed")
+
+    async def test_rate_limit_below_the_quota(self):
+        models = QuotaModels(quota=10)
+        results = await self.burst(gateway(models, rate_limits={MODEL: 9}))
+        self.assertFalse([r for r in results if isinstance(r, Exception)])
+        self.assertLessEqual(models.throttled, 1)
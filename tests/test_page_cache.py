@@ -0,0 +1,31 @@
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from src.core.page_cache import FilePageBackend, PageCache
+
+
+class FilePageBackendTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.backend = FilePageBackend(directory.name)
+
+    async def test_entries_are_json(self):
+        created_at = datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc)
+
+        async def build():
+            return {"screenplays": [{"created_at": created_at}], "html": "<ul>"}
+
+        cache = PageCache(self.backend)
+        await cache.get_or_build("gallery", build)
+        entry = await cache.get_or_build("gallery", build)
+
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(entry["html"], "<ul>")
+        self.assertEqual(
+            entry["screenplays"][0]["created_at"], "2024-05-01T12:30:00+00:00"
+        )
+
+    def test_ignores_unreadable_entries(self):
+        self.backend._path("gallery").write_bytes(b"\x80\x04not json")
+        self.assertIsNone(self.backend.get("gallery"))
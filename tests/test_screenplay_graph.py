@@ -0,0 +1,78 @@
+import asyncio
+import time
+import unittest
+from pathlib import Path
+from src.writing.model_gateway import ModelGateway
+from src.writing.screenplay_graph import ScreenplayGenerator
+from src.writing.template_loader import TemplateLoader
+from tests.fakes import FakeGenaiClient
+
+PROMPTS_DIR = Path(__file__).parents[1] / "prompts"
+
+# Seconds per model call, a generation makes three calls in sequence
+DELAY = 0.2
+PARALLEL = 10
+
+
+class ConcurrentGenerationTest(unittest.IsolatedAsyncioTestCase):
+    def generator(self, **kwargs) -> ScreenplayGenerator:
+        # Room for every call of the DAG mode, so the gateway doesn't queue any
+        client = FakeGenaiClient(DELAY)
+        gateway = ModelGateway(client, max_concurrency=2 * PARALLEL)
+        return ScreenplayGenerator(
+            client, TemplateLoader(str(PROMPTS_DIR)), gateway=gateway, **kwargs
+        )
+
+    async def assert_concurrent(self, generator: ScreenplayGenerator, **kwargs):
+        """PARALLEL generations take about as long as one"""
+        start = time.monotonic()
+        await generator.generate_from_image(b"warm-up", **kwargs)
+        one = time.monotonic() - start
+
+        start = time.monotonic()
+        states = await asyncio.gather(
+            *[
+                generator.generate_from_image(f"image-{i}".encode(), **kwargs)
+                for i in range(PARALLEL)
+            ]
+        )
+        elapsed = time.monotonic() - start
+
+        for state in states:
+            self.assertEqual(state["structured_scene"].scene_heading, "INT. CAFE - DAY")
+        # Run one after the other they would take PARALLEL times as long
+        self.assertLess(elapsed, one * 1.5, f"one: {one:.2f}s, all: {elapsed:.2f}s")
+
+    async def test_parallel_generations(self):
+        await self.assert_concurrent(self.generator())
+
+    async def test_parallel_streamed_generations(self):
+        scene_text = []
+        await self.assert_concurrent(self.generator(), on_scene_text=scene_text.append)
+        self.assertTrue(scene_text)
+
+    async def test_parallel_dag_generations(self):
+        await self.assert_concurrent(self.generator(dag=True))
+
+    async def test_streaming_keeps_the_event_loop_free(self):
+        # Each chunk of the fake stream takes 0.1s to arrive
+        generator = ScreenplayGenerator(
+            FakeGenaiClient(0.3), TemplateLoader(str(PROMPTS_DIR))
+        )
+        longest_stall = 0.0
+
+        async def tick():
+            nonlocal longest_stall
+            last = time.monotonic()
+            while True:
+                await asyncio.sleep(0.005)
+                now = time.monotonic()
+                longest_stall = max(longest_stall, now - last)
+                last = now
+
+        ticker = asyncio.create_task(tick())
+        try:
+            await generator.generate_from_image(b"image", on_scene_text=lambda _: None)
+        finally:
+            ticker.cancel()
+        self.assertLess(longest_stall, 0.05)
@@ -0,0 +1,98 @@
+import unittest
+from src.writing.screenplay_parser import (
+    ScreenplayParseError,
+    format_screenplay,
+    parse_screenplay,
+)
+from tests.fakes import SCENE_TEXT
+
+
+def types(scene: dict) -> list[str]:
+    return [element["type"] for element in scene["elements"]]
+
+
+class ParseScreenplayTest(unittest.TestCase):
+    def test_screenplay_format(self):
+        scene = parse_screenplay(
+            "Genre: Comedy\n\nScene:\nINT. CAFE - DAY\n\n"
+            "A barista stares at an espresso machine.\n\n"
+            "SFX: A loud hiss\n\n"
+            "BARISTA\n(whispering)\nNot today.\n\n"
+            "CUT TO:"
+        )
+        self.assertEqual(
+            (scene["genre"], scene["scene_heading"]), ("Comedy", "INT. CAFE - DAY")
+        )
+        self.assertEqual(types(scene), ["visual", "sound", "dialogue", "scene_ending"])
+        self.assertEqual(
+            scene["elements"][2],
+            {
+                "type": "dialogue",
+                "character": "BARISTA",
+                "line": "Not today.",
+                "manner": "whispering",
+            },
+        )
+
+    def test_elements_without_blank_lines(self):
+        scene = parse_screenplay(
+            "Scene: EXT. PARK - DAY\n"
+            "A dog drops a ball at Bob's feet.\n"
+            "BOB: Fetch!\n"
+            "ALICE (laughing): He wants you to throw it.\n"
+            "CUT TO:",
+            genre="Comedy",
+        )
+        self.assertEqual(scene["scene_heading"], "EXT. PARK - DAY")
+        self.assertEqual(
+            types(scene), ["visual", "dialogue", "dialogue", "scene_ending"]
+        )
+        self.assertEqual(scene["elements"][2]["character"], "ALICE")
+        self.assertEqual(scene["elements"][2]["manner"], "laughing")
+
+    def test_cue_in_the_middle_of_a_block(self):
+        scene = parse_screenplay(
+            "Genre: Drama\nINT. KITCHEN - NIGHT\nThe kettle whistles.\n"
+            "MOM\nWho's there?\nSFX: Footsteps\nFADE OUT."
+        )
+        self.assertEqual(types(scene), ["visual", "dialogue", "sound", "scene_ending"])
+        self.assertEqual(scene["elements"][1]["line"], "Who's there?")
+
+    def test_all_caps_action_lines(self):
+        for action in ("SILENCE.", "THE DOOR SLAMS."):
+            scene = parse_screenplay(
+                f"Genre: Drama\n\nINT. HALL - NIGHT\n\n{action}\nEveryone jumps."
+            )
+            self.assertEqual(
+                scene["elements"],
+                [{"type": "visual", "visual": f"{action} Everyone jumps."}],
+            )
+
+    def test_cue_without_dialogue(self):
+        with self.assertRaises(ScreenplayParseError):
+            parse_screenplay("Genre: Drama\n\nINT. HALL - NIGHT\n\nBOB\n\nHello there.")
+
+    def test_continuation_lines(self):
+        scene = parse_screenplay(
+            "Genre: Drama\n\nINT. KITCHEN - NIGHT\n\n"
+            "The kettle whistles.\nNobody moves.\n\n"
+            "MOM: Who's there?\nAnswer me."
+        )
+        self.assertEqual(
+            [scene["elements"][0]["visual"], scene["elements"][1]["line"]],
+            ["The kettle whistles. Nobody moves.", "Who's there? Answer me."],
+        )
+
+    def test_round_trip(self):
+        scene = parse_screenplay(SCENE_TEXT, genre="Comedy")
+        self.assertEqual(parse_screenplay(format_screenplay(scene)), scene)
+
+    def test_errors(self):
+        for text in (
+            "INT. CAFE - DAY\n\nA barista.",
+            "Genre: Comedy\n\nA barista.",
+            "Genre: Comedy\n\nINT. CAFE - DAY",
+            "Genre: Comedy\n\nINT. CAFE - DAY\n\nEXT. STREET - DAY",
+        ):
+            with self.assertRaises(ScreenplayParseError, msg=text):
+                parse_screenplay(text)
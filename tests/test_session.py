@@ -0,0 +1,59 @@
+import unittest
+from pathlib import Path
+from unittest import mock
+from jinja2 import Environment, FileSystemLoader, nodes
+from src.auth.jwt import (
+    SESSION_USER_FIELDS,
+    create_session_token,
+    decode_jwt_token,
+    session_user,
+)
+from src.core.settings import settings
+
+TEMPLATES_DIR = Path(__file__).parents[1] / "templates"
+
+
+def user_fields_read_by_templates() -> set[str]:
+    """Attributes of the current user that the templates read"""
+    env = Environment(loader=FileSystemLoader(str(TEMPLATES_DIR)))
+    fields = set()
+    for name in env.list_templates():
+        source = env.loader.get_source(env, name)[0]
+        for node in env.parse(source).find_all(nodes.Getattr):
+            if isinstance(node.node, nodes.Name) and node.node.name == "user":
+                fields.add(node.attr)
+    return fields
+
+
+class SessionSnapshotTest(unittest.TestCase):
+    user = {
+        "id": "user-1",
+        "name": "Ada",
+        "picture": "https://example.com/ada.png",
+        "email": "ada@example.com",
+        "google_id": "1234",
+        "created_at": "2025-01-01T00:00:00Z",
+    }
+
+    def session_user(self) -> dict:
+        with mock.patch.object(settings, "FAT_SESSION", True):
+            token_data = decode_jwt_token(create_session_token(self.user))
+            return session_user(token_data)
+
+    def test_snapshot_holds_the_display_fields(self):
+        snapshot = self.session_user()
+        self.assertEqual(set(snapshot), {"id", *SESSION_USER_FIELDS})
+        self.assertEqual(snapshot, {k: self.user[k] for k in snapshot})
+
+    def test_snapshot_has_what_templates_read(self):
+        fields = user_fields_read_by_templates()
+        self.assertTrue(fields)
+        self.assertLessEqual(fields, set(self.session_user()))
+
+    def test_stale_version_is_ignored(self):
+        with mock.patch.object(settings, "FAT_SESSION", True):
+            token_data = decode_jwt_token(create_session_token(self.user))
+        with mock.patch.object(settings, "SESSION_VERSION", 2), mock.patch.object(
+            settings, "FAT_SESSION", True
+        ):
+            self.assertIsNone(session_user(token_data))